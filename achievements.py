@@ -1,64 +1,227 @@
 import json
 import os
-from typing import Dict, List, Optional
+import threading
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 import logging
 from pathlib import Path
+import numpy as np
+import pandas as pd
+from storage import atomic_write_json
+from profiling import profiled
 
 
 class AchievementSystem:
-    def __init__(self, storage_file: str = "achievements.json"):
+    # Сколько записей может накопиться в журнале до его слияния со снимком
+    JOURNAL_COMPACT_THRESHOLD = 500
+
+    def __init__(self, storage_file: str = "achievements.json", journal_file: Optional[str] = None):
+        # storage_file - снимок всех достижений (прежний формат achievements.json),
+        # journal_file - журнал новых достижений, по одной JSON-записи в строке
         self.storage_file = storage_file
+        self.journal_file = journal_file or os.path.splitext(storage_file)[0] + ".jsonl"
+        self._snapshot_stamp = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._snapshot_readable = True  # Нечитаемый снимок нельзя затирать при сжатии журнала
+        # Пакетная проверка идет в пуле потоков, а обработчики выдают достижения
+        # в event loop - изменения данных и журнала выполняются под этой блокировкой
+        self._lock = threading.RLock()
         self.achievements_data: Dict[int, Dict[str, List[Dict]]] = {}
         self.available_achievements = {
             "first_login": {
                 "title": "Новичок",
                 "description": "Впервые авторизовался в системе",
                 "icon": "🆕",
-                "check_func": self._check_first_login
+                "check_func": self._check_first_login,
+                "mask_func": self._mask_first_login,
+                # Условие зависит от состояния пользователя, а не от строки таблицы
+                "user_check": self._check_first_login
             },
             "top_driver": {
                 "title": "Лучший водитель",
                 "description": "Попасть в топ-5 водителей",
                 "icon": "🏆",
-                "check_func": self._check_top_driver
+                "check_func": self._check_top_driver,
+                "mask_func": self._mask_top_driver
             },
             "workaholic": {
                 "title": "Трудоголик",
                 "description": "Наработать более 200 часов",
                 "icon": "⏱",
-                "check_func": self._check_workaholic
+                "check_func": self._check_workaholic,
+                "mask_func": self._mask_workaholic
             },
             "high_salary": {
                 "title": "Зарплатный чемпион",
                 "description": "Заработать более 100,000 руб.",
                 "icon": "💰",
-                "check_func": self._check_high_salary
+                "check_func": self._check_high_salary,
+                "mask_func": self._mask_high_salary
             },
             "veteran": {
                 "title": "Ветеран",
                 "description": "Работать более 1 года",
                 "icon": "🎖",
-                "check_func": self._check_veteran
+                "check_func": self._check_veteran,
+                "mask_func": self._mask_veteran
             }
         }
+        # Каждому достижению - свой бит; у пользователя хранится маска полученных
+        self.achievement_bits = {
+            ach_id: 1 << bit for bit, ach_id in enumerate(self.available_achievements)
+        }
+        self._user_masks: Dict[str, int] = {}
+        self._info_cache: Dict[int, List[Dict]] = {}  # {маска: результат get_all_achievements_info}
         self.load_data()
         
+    @profiled
     def load_data(self):
-        if os.path.exists(self.storage_file):
+        """Загружает снимок и дочитывает журнал.
+
+        Если снимок не менялся с прошлого вызова, читаются только новые
+        записи журнала, поэтому частые вызовы (например, из менеджера) дешевы.
+        Поврежденный снимок не сбрасывает уже загруженные данные и не
+        перезаписывается, пока снова не прочитается.
+        """
+        with self._lock:
             try:
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    self.achievements_data = json.load(f)
+                stamp = self._file_stamp(self.storage_file)
+                journal_stamp = self._file_stamp(self.journal_file)
+                journal_size = journal_stamp[1] if journal_stamp else 0
+                if stamp != self._snapshot_stamp or journal_size < self._journal_offset:
+                    # Снимок перезаписан (или журнал сжат) - читаем все заново
+                    data = {}
+                    if stamp is not None:
+                        with open(self.storage_file, 'r', encoding='utf-8') as f:
+                            data = json.load(f)
+                    self.achievements_data = data
+                    self._rebuild_masks()
+                    self._snapshot_stamp = stamp
+                    self._journal_offset = 0
+                    self._journal_entries = 0
             except Exception as e:
-                logging.error(f"Ошибка загрузки данных достижений: {e}")
-                self.achievements_data = {}
+                logging.error(f"Ошибка загрузки снимка достижений {self.storage_file}: {e}")
+                self._snapshot_readable = False
+                return
+            self._snapshot_readable = True
+            try:
+                self._replay_journal()
+            except OSError as e:
+                logging.error(f"Ошибка чтения журнала достижений: {e}")
 
+    @profiled
     def save_data(self):
-        try:
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.achievements_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logging.error(f"Ошибка сохранения данных достижений: {e}")
+        """Сжимает журнал: атомарно переписывает снимок и очищает журнал"""
+        with self._lock:
+            if not self._snapshot_readable:
+                logging.error("Снимок достижений не прочитан, сжатие журнала отложено, чтобы не потерять данные")
+                return
+            try:
+                atomic_write_json(self.storage_file, self.achievements_data, ensure_ascii=False, indent=2)
+                # Если упадем здесь, журнал просто применится к снимку повторно - записи идемпотентны
+                open(self.journal_file, 'wb').close()
+                self._snapshot_stamp = self._file_stamp(self.storage_file)
+                self._journal_offset = 0
+                self._journal_entries = 0
+            except Exception as e:
+                logging.error(f"Ошибка сохранения данных достижений: {e}")
+
+    @staticmethod
+    def _file_stamp(path: str):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _replay_journal(self):
+        """Применяет записи журнала, появившиеся после последнего чтения"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'rb') as f:
+            f.seek(self._journal_offset)
+            chunk = f.read()
+        # Недописанную последнюю строку оставляем до следующего чтения
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                self._add_achievement(str(entry['user_id']), entry['achievement'])
+            except (ValueError, KeyError, TypeError) as e:
+                # Обрывок записи после сбоя - пропускаем только его
+                logging.warning(f"Пропущена поврежденная запись журнала достижений: {e}")
+                continue
+            self._journal_entries += 1
+        self._journal_offset += end
+
+    def _rebuild_masks(self):
+        """Пересчитывает маски полученных достижений по загруженным данным"""
+        self._user_masks = {
+            user_id: self._mask_of(entry.get("achievements", []))
+            for user_id, entry in self.achievements_data.items()
+        }
+
+    def _mask_of(self, achievements: List[Dict]) -> int:
+        mask = 0
+        for achievement in achievements:
+            mask |= self.achievement_bits.get(achievement['id'], 0)
+        return mask
+
+    def _add_achievement(self, user_id: str, achievement: Dict):
+        """Добавляет достижение в память; повторная запись того же достижения игнорируется"""
+        user_entry = self.achievements_data.setdefault(user_id, {"achievements": []})
+        bit = self.achievement_bits.get(achievement['id'], 0)
+        mask = self._user_masks.get(user_id, 0)
+        if bit:
+            if mask & bit:
+                return
+        elif any(a['id'] == achievement['id'] for a in user_entry["achievements"]):
+            # Достижение, которого больше нет в списке доступных
+            return
+        user_entry["achievements"].append(achievement)
+        self._user_masks[user_id] = mask | bit
+
+    def get_user_mask(self, user_id: int) -> int:
+        """Битовая маска полученных пользователем достижений"""
+        return self._user_masks.get(str(user_id), 0)
+
+    def has_achievement(self, user_id: int, achievement_id: str) -> bool:
+        return bool(self.get_user_mask(user_id) & self.achievement_bits[achievement_id])
+
+    @profiled
+    def count_user_achievements(self, user_id: int) -> int:
+        """Сколько из доступных достижений получил пользователь"""
+        return self.get_user_mask(user_id).bit_count()
+
+    @profiled
+    def _append_journal(self, entries: List[Tuple[str, Dict]]):
+        """Дописывает новые достижения в журнал за O(число новых записей)"""
+        with self._lock:
+            try:
+                payload = b''.join(
+                    (json.dumps({"user_id": user_id, "achievement": achievement}, ensure_ascii=False) + '\n').encode('utf-8')
+                    for user_id, achievement in entries
+                )
+                with open(self.journal_file, 'a+b') as f:
+                    # Если прошлая запись оборвалась на середине строки, начинаем с новой
+                    # строки, чтобы обрывок не склеился с нашей записью
+                    if f.seek(0, os.SEEK_END) > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            payload = b'\n' + payload
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._journal_offset = f.tell()
+                self._journal_entries += len(entries)
+            except Exception as e:
+                logging.error(f"Ошибка записи журнала достижений: {e}")
+                return
+
+            if self._journal_entries >= self.JOURNAL_COMPACT_THRESHOLD:
+                self.save_data()
 
     def _check_first_login(self, user_id: int, driver_data: Dict) -> bool:
         return not self.get_user_achievements(user_id)
@@ -82,32 +245,117 @@ class AchievementSystem:
         work_days = (datetime.now() - datetime.fromisoformat(start_date)).days
         return work_days >= 365
 
+    # Векторные версии условий: маска по всей таблице водителей за один проход
+
+    def _mask_first_login(self, data: pd.DataFrame, top_licenses) -> np.ndarray:
+        return np.ones(len(data), dtype=bool)
+
+    def _mask_top_driver(self, data: pd.DataFrame, top_licenses) -> np.ndarray:
+        licenses = data['Вод. Удоств.'].astype(str).str.strip()
+        return licenses.isin(top_licenses).to_numpy()
+
+    def _mask_workaholic(self, data: pd.DataFrame, top_licenses) -> np.ndarray:
+        hours = pd.to_numeric(data['Часы'], errors='coerce')
+        return (hours >= 200).to_numpy()
+
+    def _mask_high_salary(self, data: pd.DataFrame, top_licenses) -> np.ndarray:
+        salary = pd.to_numeric(data['ЗП'], errors='coerce')
+        return (salary >= 100000).to_numpy()
+
+    def _mask_veteran(self, data: pd.DataFrame, top_licenses) -> np.ndarray:
+        if 'start_date' not in data.columns:
+            return np.zeros(len(data), dtype=bool)
+        start_dates = pd.to_datetime(data['start_date'], errors='coerce')
+        return ((pd.Timestamp.now() - start_dates).dt.days >= 365).to_numpy()
+
+    def _new_achievement(self, achievement_id: str, date: str) -> Dict:
+        achievement = self.available_achievements[achievement_id]
+        return {
+            "id": achievement_id,
+            "title": achievement["title"],
+            "description": achievement["description"],
+            "icon": achievement["icon"],
+            "date": date
+        }
+
+    @profiled
+    def check_achievements_batch(self, data: pd.DataFrame, license_by_user: Dict[int, str],
+                                 license_index: Dict[str, int], top_licenses) -> Dict[int, List[Dict]]:
+        """Проверяет достижения сразу для многих пользователей.
+
+        Каждое условие вычисляется один раз как маска по всей таблице,
+        затем маски соединяются с привязанными пользователями по позиции
+        строки. Возвращает {user_id: [новые достижения]}.
+        """
+        users = [
+            (user_id, license_index[license_number])
+            for user_id, license_number in license_by_user.items()
+            if license_number in license_index
+        ]
+        if not users or data.empty:
+            return {}
+
+        positions = np.fromiter((position for _, position in users), dtype=np.intp, count=len(users))
+        ids = list(self.available_achievements)
+        hits = np.column_stack([
+            np.asarray(self.available_achievements[ach_id]["mask_func"](data, top_licenses), dtype=bool)[positions]
+            for ach_id in ids
+        ])
+
+        with self._lock:
+            date = datetime.now().isoformat()
+            awarded: Dict[int, List[Dict]] = {}
+            for row in np.flatnonzero(hits.any(axis=1)):
+                user_id = users[row][0]
+                user_mask = self.get_user_mask(user_id)
+                for col in np.flatnonzero(hits[row]):
+                    ach_id = ids[col]
+                    if user_mask & self.achievement_bits[ach_id]:
+                        continue
+                    # Новые достижения добавляются в хранилище после цикла, поэтому
+                    # пользовательские условия видят состояние до проверки
+                    user_check = self.available_achievements[ach_id].get("user_check")
+                    if user_check is not None and not user_check(user_id, {}):
+                        continue
+                    awarded.setdefault(user_id, []).append(self._new_achievement(ach_id, date))
+
+            entries = [
+                (str(user_id), achievement)
+                for user_id, new_achievements in awarded.items()
+                for achievement in new_achievements
+            ]
+            for user_id, achievement in entries:
+                self._add_achievement(user_id, achievement)
+
+            if entries:
+                self._append_journal(entries)  # Одна запись на всю пачку
+
+            return awarded
+
+    @profiled
     def check_achievements(self, user_id: int, driver_data: Dict) -> List[Dict]:
-        if str(user_id) not in self.achievements_data:
-            self.achievements_data[str(user_id)] = {"achievements": []}
+        with self._lock:
+            if str(user_id) not in self.achievements_data:
+                self.achievements_data[str(user_id)] = {"achievements": []}
             
-        new_achievements = []
+            new_achievements = []
         
-        for achievement_id, achievement in self.available_achievements.items():
-            if any(a['id'] == achievement_id for a in self.get_user_achievements(user_id)):
-                continue
+            for achievement_id, achievement in self.available_achievements.items():
+                if self.has_achievement(user_id, achievement_id):
+                    continue
                 
-            if achievement["check_func"](user_id, driver_data):
-                new_achievement = {
-                    "id": achievement_id,
-                    "title": achievement["title"],
-                    "description": achievement["description"],
-                    "icon": achievement["icon"],
-                    "date": datetime.now().isoformat()
-                }
-                new_achievements.append(new_achievement)
-                self.achievements_data[str(user_id)]["achievements"].append(new_achievement)
+                if achievement["check_func"](user_id, driver_data):
+                    new_achievement = self._new_achievement(achievement_id, datetime.now().isoformat())
+                    new_achievements.append(new_achievement)
+                    self._add_achievement(str(user_id), new_achievement)
         
-        if new_achievements:
-            self.save_data()  # Сохраняем изменения сразу
+            if new_achievements:
+                # Сохраняем изменения сразу, дописывая их в журнал
+                self._append_journal([(str(user_id), a) for a in new_achievements])
         
-        return new_achievements
+            return new_achievements
 
+    @profiled
     def get_user_achievements(self, user_id: int) -> List[Dict]:
         return self.achievements_data.get(str(user_id), {}).get("achievements", [])
 
@@ -127,19 +375,25 @@ class AchievementSystem:
             message += self.format_achievement(achievement) + "\n\n"
         return message
     
+    @profiled
     def get_all_achievements_info(self, user_id: int = None) -> List[Dict]:
-        """Возвращает информацию о всех достижениях с отметкой о получении"""
-        user_achievements = self.get_user_achievements(user_id) if user_id else []
-        achieved_ids = {a['id'] for a in user_achievements}
-        
-        result = []
-        for ach_id, ach in self.available_achievements.items():
-            ach_copy = ach.copy()
-            ach_copy['id'] = ach_id
-            ach_copy['achieved'] = ach_id in achieved_ids
-            result.append(ach_copy)
-        
-        return sorted(result, key=lambda x: x['achieved'], reverse=True)
+        """Возвращает информацию о всех достижениях с отметкой о получении.
+
+        Результат общий для всех пользователей с одинаковой маской и
+        кэшируется, поэтому изменять возвращаемый список нельзя.
+        """
+        mask = self.get_user_mask(user_id) if user_id else 0
+        result = self._info_cache.get(mask)
+        if result is None:
+            result = []
+            for ach_id, ach in self.available_achievements.items():
+                ach_copy = ach.copy()
+                ach_copy['id'] = ach_id
+                ach_copy['achieved'] = bool(mask & self.achievement_bits[ach_id])
+                result.append(ach_copy)
+            result = sorted(result, key=lambda x: x['achieved'], reverse=True)
+            self._info_cache[mask] = result
+        return result
 
 achievement_system = AchievementSystem()
 
@@ -0,0 +1,156 @@
+"""Масштабный бенчмарк DriverDatabase на синтетических книгах Excel.
+
+Для каждого размера парка (по умолчанию 1k, 10k, 100k и 500k водителей)
+создаются две книги с реальной схемой столбцов: исходная и версия, где у
+1% водителей изменилась зарплата. Каждый размер измеряется в отдельном
+процессе, чтобы пиковое потребление памяти (RSS) не смешивалось.
+
+Результат - по одной JSON-строке на размер (stdout и, при --output, файл):
+время load_data (разбор Excel и загрузка из снимка), load_links,
+get_top_drivers, find_driver_by_license, полного цикла check_drivers_updates
+и пиковый RSS.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_database.py --sizes 1000 10000 --output results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+from synthetic import make_drivers_frame  # noqa: E402
+
+BENCH_TOKEN = "123456:BENCHMARKbenchmarkBENCHMARKbenchmark"
+DEFAULT_SIZES = [1000, 10000, 100000, 500000]
+
+
+def peak_rss_bytes():
+    """Пиковый RSS текущего процесса"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux отдает килобайты, macOS - байты
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+
+
+def prepare_workbooks(data_dir: str, size: int, seed: int):
+    """Создает (или берет готовые) исходную и измененную книги для размера"""
+    os.makedirs(data_dir, exist_ok=True)
+    base_path = os.path.join(data_dir, f"drivers_{size}.xlsx")
+    changed_path = os.path.join(data_dir, f"drivers_{size}_changed.xlsx")
+    if not (os.path.exists(base_path) and os.path.exists(changed_path)):
+        data = make_drivers_frame(size, seed)
+        data.to_excel(base_path, index=False)
+        changed = data.copy()
+        rows = random.Random(seed).sample(range(size), max(1, size // 100))
+        changed.loc[rows, 'ЗП'] = changed.loc[rows, 'ЗП'] + 1000
+        changed.to_excel(changed_path, index=False)
+    return base_path, changed_path
+
+
+def timed(func, repeat: int = 1):
+    """Среднее время одного вызова в секундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def run_worker(args):
+    """Измеряет один размер; вызывается в отдельном процессе"""
+    workdir = tempfile.mkdtemp(prefix='taxibot-dbbench-')
+    os.environ['TELEGRAM_BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['EXCEL_PATH'] = args.base_path
+    os.chdir(workdir)
+
+    started = time.perf_counter()
+    import bot
+    startup = time.perf_counter() - started
+    db = bot.db
+    result = {"drivers": len(db.data), "startup_seconds": startup}
+
+    # Разбор Excel без снимка и загрузка из готового снимка
+    def reload(drop_snapshot):
+        if drop_snapshot:
+            shutil.rmtree(db.snapshot_cache.cache_dir, ignore_errors=True)
+        db.last_modified = 0
+        db.load_data()
+    result["load_data_parse_seconds"] = timed(lambda: reload(True))
+    result["load_data_snapshot_seconds"] = timed(lambda: reload(False))
+
+    # Привязываем долю водителей к синтетическим пользователям Telegram
+    licenses = list(db.license_index)
+    rng = random.Random(args.seed)
+    linked = rng.sample(licenses, int(len(licenses) * args.linked_share))
+    with open(db.storage_file, 'w', encoding='utf-8') as f:
+        json.dump({str(10 ** 8 + i): {"license": lic, "name": ""} for i, lic in enumerate(linked)}, f)
+    result["linked_users"] = len(linked)
+    result["load_links_seconds"] = timed(db.load_links)
+
+    result["get_top_drivers_seconds"] = timed(db.get_top_drivers, repeat=100)
+    lookups = [rng.choice(licenses) for _ in range(args.lookups)]
+    result["find_driver_by_license_seconds"] = timed(lambda: [db.find_driver_by_license(l) for l in lookups]) / len(lookups)
+
+    # Полный цикл перезагрузки: разбор измененной книги и все этапы конвейера
+    db.subscribe_changes(bot.check_achievements_for_changes)
+    db.source = db._create_source(args.changed_path)
+    result["check_drivers_updates_seconds"] = timed(lambda: asyncio.run(bot.check_drivers_updates(None)))
+    result["changed_rows"] = len(db.last_changes.changed)
+
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    db.links_writer.flush()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="размеры парка")
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'taxibot-bench-data'),
+                        help="где хранить сгенерированные книги между запусками")
+    parser.add_argument('--linked-share', type=float, default=0.2, help="доля водителей с привязанным Telegram")
+    parser.add_argument('--lookups', type=int, default=10000, help="число поисков по удостоверению")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', metavar='PATH', help="дописать результаты в файл JSON Lines")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--base-path', help=argparse.SUPPRESS)
+    parser.add_argument('--changed-path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    for size in args.sizes:
+        base_path, changed_path = prepare_workbooks(args.data_dir, size, args.seed)
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker',
+             '--base-path', base_path, '--changed-path', changed_path,
+             '--linked-share', str(args.linked_share), '--lookups', str(args.lookups),
+             '--seed', str(args.seed)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["size"] = size
+        line = json.dumps(result)
+        print(line, flush=True)
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Нагрузочный тест обработчиков команд бота.
+
+Бот работает в этом же процессе, вместо серверов Telegram используется
+подставной HTTP-транспорт. Синтетические пользователи проходят авторизацию
+(/start + номер удостоверения), после чего параллельно отправляют
+случайную смесь /stats, /top, /all_achievements и кнопки «Показать все
+достижения». Скрипт печатает p50/p95/p99 задержки каждого обработчика
+и общую пропускную способность.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_handlers.py --users 2000 --commands 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from telegram.request import BaseRequest  # noqa: E402
+
+from synthetic import write_workbook  # noqa: E402
+
+BENCH_TOKEN = "123456:BENCHMARKbenchmarkBENCHMARKbenchmark"
+
+
+class FakeTelegramAPI(BaseRequest):
+    """Подставной транспорт Bot API: отвечает как Telegram, не выходя в сеть"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self._message_id = 10 ** 6
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        params = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif endpoint == 'sendMessage':
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": params.get('chat_id'), "type": "private"},
+                "text": params.get('text', '')
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode('utf-8')
+
+
+def make_update(bot, update_id: int, user_id: int, text: str):
+    from telegram import Update
+
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        "text": text
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return Update.de_json({"update_id": update_id, "message": message}, bot)
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "count": len(values),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max())
+    }
+
+
+async def run(args):
+    import bot
+
+    api = FakeTelegramAPI(latency=args.api_latency / 1000)
+    application = bot.build_application(request=api)
+    await application.initialize()
+    await application.post_init(application)
+    # JobQueue нужна для отложенного удаления служебных сообщений
+    await application.job_queue.start()
+
+    rng = random.Random(args.seed)
+    licenses = list(bot.db.license_index)
+    user_ids = [10 ** 8 + i for i in range(min(args.users, len(licenses)))]
+    latencies = defaultdict(list)
+    update_ids = iter(range(1, 10 ** 9))
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def send(label, user_id, text):
+        update = make_update(application.bot, next(update_ids), user_id, text)
+        async with semaphore:
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies[label].append(time.perf_counter() - started)
+
+    async def onboard(user_id, license_number):
+        await send('start', user_id, '/start')
+        await send('handle_license', user_id, license_number)
+
+    mix = [
+        ('stats', '/stats'),
+        ('top_drivers', '/top'),
+        ('all_achievements', '/all_achievements'),
+        ('all_achievements_button', 'Показать все достижения')
+    ]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(onboard(user_id, licenses[i]) for i, user_id in enumerate(user_ids)))
+    onboarding_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        send(label, rng.choice(user_ids), text)
+        for label, text in (rng.choice(mix) for _ in range(args.commands))
+    ))
+    mixed_time = time.perf_counter() - started
+    outbound_stats = bot.outbound_scheduler.stats()
+
+    # Даем выполниться отложенным удалениям, чтобы они попали в счетчик вызовов API
+    await asyncio.sleep(bot.message_cleanup.delay + 0.5)
+    await application.job_queue.stop()
+    await application.post_shutdown(application)
+    await application.shutdown()
+
+    report = {
+        "users": len(user_ids),
+        "linked_users": len(bot.db.linked_users),
+        "drivers": len(bot.db.data),
+        "commands": args.commands,
+        "concurrency": args.concurrency,
+        "api_latency_ms": args.api_latency,
+        "onboarding_seconds": onboarding_time,
+        "mixed_seconds": mixed_time,
+        "mixed_throughput_per_second": args.commands / mixed_time if mixed_time else None,
+        "api_calls": dict(api.calls),
+        "outbound": outbound_stats,
+        "handlers": {label: percentiles(samples) for label, samples in sorted(latencies.items())}
+    }
+    return report
+
+
+def print_report(report):
+    print(f"Водителей: {report['drivers']}, пользователей: {report['users']} "
+          f"(привязано {report['linked_users']}), параллельность: {report['concurrency']}")
+    print(f"Авторизация: {report['onboarding_seconds']:.2f} с; смешанная нагрузка: "
+          f"{report['commands']} команд за {report['mixed_seconds']:.2f} с "
+          f"({report['mixed_throughput_per_second']:.0f} команд/с)")
+    print(f"{'обработчик':<26}{'n':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'max, мс':>10}")
+    for label, stats in report['handlers'].items():
+        print(f"{label:<26}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    print(f"Вызовы Bot API: {report['api_calls']}")
+    for lane, stats in report['outbound'].items():
+        if stats['granted']:
+            print(f"Планировщик, полоса {lane}: разрешений {stats['granted']}, "
+                  f"среднее ожидание {stats['avg_wait_seconds'] * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--drivers', type=int, default=5000, help="водителей в синтетическом Excel")
+    parser.add_argument('--users', type=int, default=2000, help="синтетических пользователей Telegram")
+    parser.add_argument('--commands', type=int, default=20000, help="команд в смешанной нагрузке")
+    parser.add_argument('--concurrency', type=int, default=256, help="одновременно обрабатываемых обновлений")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="имитируемая задержка Bot API, мс")
+    parser.add_argument('--global-rate', type=float, default=0,
+                        help="общий лимит исходящих вызовов в секунду (0 - без лимита, как по умолчанию в бенчмарке)")
+    parser.add_argument('--chat-rate', type=float, default=0,
+                        help="лимит вызовов в секунду на чат (0 - без лимита)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help="дополнительно сохранить отчет в JSON")
+    args = parser.parse_args()
+    if args.json:
+        args.json = os.path.abspath(args.json)
+
+    workdir = tempfile.mkdtemp(prefix='taxibot-bench-')
+    excel_path = os.path.join(workdir, 'drivers.xlsx')
+    write_workbook(excel_path, args.drivers, seed=args.seed)
+
+    # Бот хранит привязки, достижения и лог в текущей папке - уводим их во временную
+    os.environ['TELEGRAM_BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['EXCEL_PATH'] = excel_path
+    # Лимиты Telegram по умолчанию выключены, чтобы мерить сами обработчики
+    os.environ['OUTBOUND_GLOBAL_RATE'] = str(args.global_rate)
+    os.environ['OUTBOUND_CHAT_RATE'] = str(args.chat_rate)
+    os.chdir(workdir)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
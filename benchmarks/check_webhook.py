@@ -0,0 +1,141 @@
+"""Сквозная проверка режима webhook.
+
+Бот запускается в этом же процессе через Updater.start_webhook на локальном
+порту, вместо серверов Telegram используется подставной транспорт из
+bench_handlers. Скрипт отправляет обновление /start POST-запросом без
+заголовка X-Telegram-Bot-Api-Secret-Token, с неверным и с верным секретом
+и проверяет ответы (403, 403, 200), а также что бот обработал только
+последнее обновление.
+
+Нужен python-telegram-bot[webhooks] (tornado). Запуск из корня репозитория:
+    python benchmarks/check_webhook.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_handlers import BENCH_TOKEN, FakeTelegramAPI  # noqa: E402
+from synthetic import write_workbook  # noqa: E402
+
+SECRET = "check-webhook-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def post_update(url: str, update_id: int, user_id: int, secret=None) -> int:
+    """Отправляет обновление /start как Telegram и возвращает HTTP-код ответа"""
+    text = '/start'
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        "text": text,
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    }
+    headers = {"Content-Type": "application/json"}
+    if secret is not None:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({"update_id": update_id, "message": message}).encode('utf-8'),
+        headers=headers,
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+async def run(args):
+    import bot
+
+    api = FakeTelegramAPI()
+    application = bot.build_application(request=api)
+    await application.initialize()
+    await application.post_init(application)
+    await application.updater.start_webhook(
+        listen='127.0.0.1',
+        port=args.port,
+        url_path=bot.WEBHOOK_PATH,
+        webhook_url=f"https://example.invalid/{bot.WEBHOOK_PATH}",
+        secret_token=SECRET
+    )
+    await application.start()
+
+    url = f"http://127.0.0.1:{args.port}/{bot.WEBHOOK_PATH}"
+    loop = asyncio.get_running_loop()
+    cases = [
+        ("без секрета", None, 403),
+        ("неверный секрет", SECRET + "-wrong", 403),
+        ("верный секрет", SECRET, 200)
+    ]
+    results = []
+    sent_before = api.calls['sendMessage']
+    try:
+        for update_id, (label, secret, expected) in enumerate(cases, 1):
+            status = await loop.run_in_executor(None, post_update, url, update_id, 10 ** 8 + update_id, secret)
+            results.append((label, status, expected))
+        # Обновление обрабатывается асинхронно после ответа 200
+        deadline = loop.time() + 5
+        while api.calls['sendMessage'] == sent_before and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_shutdown(application)
+        await application.shutdown()
+    return results, api.calls['sendMessage'] - sent_before, dict(api.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=0, help="локальный порт webhook (0 - любой свободный)")
+    parser.add_argument('--drivers', type=int, default=100, help="водителей в синтетическом Excel")
+    args = parser.parse_args()
+    args.port = args.port or free_port()
+
+    workdir = tempfile.mkdtemp(prefix='taxibot-webhook-')
+    excel_path = os.path.join(workdir, 'drivers.xlsx')
+    write_workbook(excel_path, args.drivers)
+
+    # Бот хранит привязки, достижения и лог в текущей папке - уводим их во временную
+    os.environ['TELEGRAM_BOT_TOKEN'] = BENCH_TOKEN
+    os.environ['EXCEL_PATH'] = excel_path
+    os.environ['OUTBOUND_GLOBAL_RATE'] = '0'
+    os.environ['OUTBOUND_CHAT_RATE'] = '0'
+    os.chdir(workdir)
+
+    results, handled, calls = asyncio.run(run(args))
+    failed = False
+    for label, status, expected in results:
+        ok = status == expected
+        failed |= not ok
+        print(f"{label:<18} HTTP {status} (ожидается {expected}) {'OK' if ok else 'ОШИБКА'}")
+    # Ответить должен только на обновление с верным секретом
+    print(f"Вызовы Bot API: {calls}")
+    if handled != 1:
+        failed = True
+        print(f"ОШИБКА: обработано обновлений с ответом {handled}, ожидалось 1")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
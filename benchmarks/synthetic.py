@@ -0,0 +1,24 @@
+"""Синтетические данные водителей с реальной схемой листа Excel"""
+import numpy as np
+import pandas as pd
+
+
+def make_drivers_frame(count: int, seed: int = 0) -> pd.DataFrame:
+    """Таблица из count водителей со столбцами как в рабочем файле"""
+    rng = np.random.default_rng(seed)
+    start_dates = pd.Timestamp.now().normalize() - pd.to_timedelta(rng.integers(0, 5 * 365, count), unit='D')
+    return pd.DataFrame({
+        'ID': np.arange(1, count + 1),
+        'Имя': [f"Водитель {i}" for i in range(1, count + 1)],
+        'Вод. Удоств.': [f"{i:010d}" for i in rng.permutation(count) + 10 ** 9],
+        'Часы': rng.integers(0, 320, count),
+        'ЗП': rng.integers(15000, 180000, count),
+        'start_date': start_dates.strftime('%Y-%m-%d')
+    })
+
+
+def write_workbook(path: str, count: int, seed: int = 0) -> pd.DataFrame:
+    """Записывает синтетическую книгу Excel и возвращает ее содержимое"""
+    data = make_drivers_frame(count, seed)
+    data.to_excel(path, index=False)
+    return data
@@ -1,4 +1,5 @@
-from telegram import Update, BotCommandScopeChat, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,24 +14,41 @@ import pandas as pd
 import json
 import os
 import asyncio
-from datetime import datetime, timedelta
+import atexit
+import re
+import time
 from dotenv import load_dotenv
 from pathlib import Path
+from typing import Dict
 from achievements import get_achievement_instance
+from snapshot_cache import SnapshotCache
+from excel_reader import DRIVER_COLUMNS, resolve_engine
+from data_sources import DEPOT_COLUMN, SOURCE_KINDS, create_data_source
+from storage import WriteBehindWriter
+from data_diff import DataChanges, diff_drivers
+from ranking import DriverRanking
+from render_cache import RenderCache
+from notifications import NotificationDispatcher
+from command_menus import CommandMenuManager
+from outbound import OutboundScheduler, ScheduledRequest
+from message_cleanup import MessageCleanup
+import profiling
+from profiling import profile_handler, profiled
+from metrics import (
+    ACHIEVEMENTS_AWARDED, DATA_VERSION, LINKED_USERS, RELOAD_DURATION, RELOAD_ROWS,
+    TELEGRAM_API_ERRORS, TELEGRAM_API_LATENCY, start_metrics_server, track_handler
+)
 
+@profile_handler('remove_keyboard')
 async def remove_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Удаляет клавиатуру из предыдущего сообщения"""
     if 'keyboard_active' in context.user_data and context.user_data['keyboard_active']:
-        await update.message.reply_text(
+        message = await update.message.reply_text(
             "Убираю клавиатуру...",
             reply_markup=ReplyKeyboardRemove()
         )
-        # Удаляем сообщение "Убираю клавиатуру..." через 1 секунду
-        await asyncio.sleep(1)
-        await context.bot.delete_message(
-            chat_id=update.effective_chat.id,
-            message_id=update.message.message_id + 1
-        )
+        # Сообщение "Убираю клавиатуру..." удалится в фоне через секунду
+        message_cleanup.schedule(message.chat_id, message.message_id)
         context.user_data['keyboard_active'] = False
 
 # Настройка логирования (должна быть в самом начале)
@@ -39,157 +57,347 @@ log_handler.setFormatter(logging.Formatter(
     '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 ))
 logger = logging.getLogger(__name__)
-logger.addHandler(log_handler)
-logger.setLevel(logging.INFO)
+for module_logger in (logger, logging.getLogger('snapshot_cache'), logging.getLogger('data_sources'),
+                      logging.getLogger('storage'),
+                      logging.getLogger('notifications'), logging.getLogger('command_menus'),
+                      logging.getLogger('outbound'), logging.getLogger('message_cleanup'),
+                      logging.getLogger('metrics'),
+                      logging.getLogger('profiling')):
+    module_logger.addHandler(log_handler)
+    module_logger.setLevel(logging.INFO)
 
 # Загрузка .env файла
 env_path = Path(__file__).parent / '.env'
-if not env_path.exists():
+if env_path.exists():
+    try:
+        # Просто передаем путь к файлу; уже заданные переменные окружения не перезаписываются
+        load_dotenv(env_path)
+        logger.info(".env файл успешно загружен")
+    except Exception as e:
+        logger.error(f"Ошибка загрузки .env файла: {str(e)}")
+        raise
+elif not (os.getenv("TELEGRAM_BOT_TOKEN") and os.getenv("EXCEL_PATH")):
+    # Без .env можно работать только если настройки переданы через окружение (бенчмарки)
     logger.error(f"Файл .env не найден по пути: {env_path}")
     raise FileNotFoundError(f"Файл .env не найден по пути: {env_path}")
 
-try:
-    # Просто передаем путь к файлу
-    load_dotenv(env_path)
-    logger.info(".env файл успешно загружен")
-except Exception as e:
-    logger.error(f"Ошибка загрузки .env файла: {str(e)}")
-    raise
-
 # Получение переменных окружения
-EXCEL_PATH = os.getenv("EXCEL_PATH")
+EXCEL_PATH = os.getenv("EXCEL_PATH")  # Путь к файлу данных (Excel, CSV, Parquet или базе SQLite)
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+SNAPSHOT_CACHE_DIR = os.getenv("SNAPSHOT_CACHE_DIR", ".excel_cache")
+RELOAD_INTERVAL = int(os.getenv("RELOAD_INTERVAL", "60"))  # секунды
+EXCEL_ENGINE = os.getenv("EXCEL_ENGINE", "auto")  # auto, openpyxl или calamine
+DATA_SOURCE = os.getenv("DATA_SOURCE", "auto").strip().lower()  # auto (по расширению), excel, csv, parquet, sqlite
+DATA_CSV_SEPARATOR = os.getenv("DATA_CSV_SEPARATOR", ",")
+DATA_SQLITE_TABLE = os.getenv("DATA_SQLITE_TABLE", "drivers")
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()  # Публичный https-адрес без пути, WEBHOOK_PATH добавляется сам
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = os.getenv("WEBHOOK_PORT", "8443")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram").strip('/')
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+
+# Лимиты исходящих вызовов Bot API (0 - без лимита)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))  # вызовов в секунду на бота
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))  # вызовов в секунду на чат
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))  # сколько вызовов в чат можно сделать подряд
+
+# Локальный HTTP-эндпоинт метрик в формате Prometheus (пусто - выключен)
+METRICS_PORT = os.getenv("METRICS_PORT", "").strip()
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+if profiling.ENABLED:
+    logger.info(f"Профилирование включено: порог медленных вызовов {profiling.SLOW_MS:.0f} мс, "
+                f"tracemalloc {'включен' if profiling.TRACE_MEMORY else 'выключен'}")
+
+def validate_webhook_settings(webhook_url, port, secret, path=WEBHOOK_PATH):
+    """Проверяет настройки webhook и возвращает список ошибок"""
+    errors = []
+    if not webhook_url:
+        errors.append("Не указан адрес webhook")
+    elif not webhook_url.startswith('https://'):
+        errors.append("Адрес webhook должен начинаться с https://")
+    elif path and webhook_url.rstrip('/').endswith('/' + path):
+        # Путь добавляется к адресу при запуске, иначе он задублируется
+        errors.append(f"Адрес webhook указывается без пути /{path}: он добавляется автоматически")
+    if not str(port).isdigit() or not 0 < int(port) < 65536:
+        errors.append("Порт webhook должен быть числом от 1 до 65535")
+    # Требования Telegram к secret_token: 1-256 символов A-Z, a-z, 0-9, _ и -
+    if not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', secret or ''):
+        errors.append("Секрет webhook должен состоять из 1-256 символов A-Z, a-z, 0-9, _ и -")
+    return errors
 
 if not TOKEN or not EXCEL_PATH:
     logger.error("Не заданы TOKEN или EXCEL_PATH в .env файле!")
     raise ValueError("Не заданы TOKEN или EXCEL_PATH в .env файле!")
 
+try:
+    EXCEL_READ_ENGINE = resolve_engine(EXCEL_ENGINE)
+    logger.info(f"Движок чтения Excel: {EXCEL_READ_ENGINE or 'выбор pandas по типу файла'}")
+except (ValueError, ImportError) as e:
+    logger.error(f"Неверная настройка EXCEL_ENGINE: {e}")
+    raise
+
+if DATA_SOURCE not in SOURCE_KINDS:
+    logger.error(f"Неверная настройка DATA_SOURCE: {DATA_SOURCE}")
+    raise ValueError(f"DATA_SOURCE должен быть одним из: {', '.join(SOURCE_KINDS)}")
+
 class DriverDatabase:
     def __init__(self):
         self.last_modified = 0
-        self.top_cache = None
-        self.cache_time = None
-        self.data = pd.DataFrame(columns=['ID', 'Имя', 'Вод. Удоств.', 'Часы', 'ЗП'])
-        self.linked_users: Dict[int, Dict[str, Any]] = {}  # {tg_id: {license, name, driver_data}}
+        self.data = pd.DataFrame(columns=DRIVER_COLUMNS)
+        self.license_index: Dict[str, int] = {}  # {номер удостоверения: позиция строки}
+        self.ranking = DriverRanking(self.data, self.license_index)
+        # Привязка хранит только номер удостоверения: данные водителя берутся
+        # из текущей версии таблицы по индексу, а не копируются пользователю
+        self.linked_users: Dict[int, str] = {}  # {tg_id: номер удостоверения}
+        self.user_by_license: Dict[str, int] = {}  # Обратный индекс {номер удостоверения: tg_id}
         self.storage_file = "driver_links.json"
+        # Привязки пишутся на диск в фоне: серия изменений - одна атомарная запись
+        self.links_writer = WriteBehindWriter(self.storage_file, delay=1.0, ensure_ascii=False, indent=2)
+        atexit.register(self.links_writer.flush)
+        self.snapshot_cache = SnapshotCache(SNAPSHOT_CACHE_DIR)
+        self.source = self._create_source(EXCEL_PATH)
+        self.version = 0  # Версия набора данных, растет при каждой подмене таблицы
+        self.change_listeners = []  # Этапы конвейера перезагрузки: callback(changes)
+        self.last_changes = DataChanges()
+        self.reload_lock = asyncio.Lock()
+        # Таблица, индекс и рейтинг (топ) подменяются вместе, одной версией;
+        # этапы конвейера (достижения) запускаются уже после подмены
         self.load_data()
         self.load_links()
         
-    async def periodic_data_update(self, interval: int = 60):
-        """Периодическое обновление данных из Excel"""
-        while True:
+    def subscribe_changes(self, callback):
+        """Добавляет этап callback(changes: DataChanges) в конец конвейера перезагрузки"""
+        self.change_listeners.append(callback)
+
+    def _notify_changes(self, changes):
+        """Выполняет этапы конвейера по порядку; ошибка этапа не останавливает следующие"""
+        for callback in self.change_listeners:
             try:
-                old_data = self.data.copy()
-                self.load_data()
-                
-                # Обновляем данные для привязанных пользователей
-                for user_id, user_data in self.linked_users.items():
-                    license_number = user_data['license']
-                    driver = self.find_driver_by_license(license_number)
-                    if driver is not None:
-                        self.linked_users[user_id]['driver_data'] = driver.to_dict()
-                
-                # Логируем изменения, если они есть
-                if not self.data.equals(old_data):
-                    logger.info("Данные из Excel успешно обновлены")
-                    self.save_links()  # Сохраняем обновленные данные
-                    
+                callback(changes)
             except Exception as e:
-                logger.error(f"Ошибка при периодическом обновлении данных: {e}")
-            
-            await asyncio.sleep(interval)
+                logger.error(f"Ошибка обработчика изменений данных {callback}: {e}", exc_info=True)
 
+    @profiled
     def load_data(self):
+        """Синхронная перезагрузка (при старте и из менеджера)"""
         try:
-            mod_time = os.path.getmtime(EXCEL_PATH)
+            mod_time = self.source.version()
             if mod_time != self.last_modified:
-                # Читаем Excel файл
-                new_data = pd.read_excel(EXCEL_PATH)
-                
-                # Проверяем обязательные столбцы
-                required_columns = ['Имя', 'Часы', 'ЗП']
-                for col in required_columns:
-                    if col not in new_data.columns:
-                        raise ValueError(f"Отсутствует обязательный столбец: {col}")
-                
-                # Преобразуем типы данных
-                new_data['Часы'] = pd.to_numeric(new_data['Часы'], errors='coerce')
-                new_data['ЗП'] = pd.to_numeric(new_data['ЗП'], errors='coerce')
-                
-                # Удаляем строки с пустыми значениями
-                new_data = new_data.dropna(subset=['Имя', 'Часы', 'ЗП'])
-                
-                self.data = new_data
-                self.last_modified = mod_time
-                logger.info("Данные успешно загружены. Записей: %d", len(self.data))
-                
-                # Сбрасываем кэш топа
-                self.top_cache = None
+                with RELOAD_DURATION.time():
+                    changes = self._apply_data(self._prepare_data(self.data), mod_time)
+                if changes is not None:
+                    self._notify_changes(changes)
                 
         except Exception as e:
             logger.error(f"Ошибка загрузки данных: {str(e)}", exc_info=True)
-            self.data = pd.DataFrame(columns=['ID', 'Имя', 'Вод. Удоств.', 'Часы', 'ЗП'])
+            self.data = pd.DataFrame(columns=DRIVER_COLUMNS)
+            self.license_index = {}
+            self.ranking = DriverRanking(self.data, self.license_index)
+            self.version += 1  # Кэш ответов не должен отдавать тексты по старой таблице
+            DATA_VERSION.set(self.version)
+
+    @profiled
+    async def load_data_async(self):
+        """Перезагрузка без блокировки event loop.
+
+        Разбор файла, сравнение версий и построение индекса выполняются в пуле
+        потоков, а в event loop происходит только замена ссылок. Пока идет
+        перезагрузка, обработчики работают с предыдущей версией данных.
+        Этапы конвейера (проверка достижений) тоже выполняются в пуле потоков.
+        """
+        async with self.reload_lock:
+            try:
+                mod_time = self.source.version()
+                if mod_time == self.last_modified:
+                    return
+                loop = asyncio.get_running_loop()
+                started = time.perf_counter()
+                prepared = await loop.run_in_executor(None, self._prepare_data, self.data)
+                changes = self._apply_data(prepared, mod_time)
+                RELOAD_DURATION.observe(time.perf_counter() - started)
+                if changes is not None:
+                    await loop.run_in_executor(None, self._notify_changes, changes)
+            except Exception as e:
+                # В отличие от синхронной загрузки, оставляем предыдущую версию данных
+                logger.error(f"Ошибка фоновой загрузки данных: {str(e)}", exc_info=True)
+
+    @profiled
+    def _prepare_data(self, current_data):
+        """Читает и проверяет новую версию данных; не изменяет состояние базы"""
+        # Читаем источник данных (для Excel - возможно, готовый снимок)
+        new_data = self.read_source()
+        
+        # Проверяем обязательные столбцы
+        required_columns = ['Имя', 'Часы', 'ЗП']
+        for col in required_columns:
+            if col not in new_data.columns:
+                raise ValueError(f"Отсутствует обязательный столбец: {col}")
+        
+        # Преобразуем типы данных
+        new_data['Часы'] = pd.to_numeric(new_data['Часы'], errors='coerce')
+        new_data['ЗП'] = pd.to_numeric(new_data['ЗП'], errors='coerce')
+        
+        # Удаляем строки с пустыми значениями
+        new_data = self._compact(new_data.dropna(subset=['Имя', 'Часы', 'ЗП']))
+        
+        changes = diff_drivers(current_data, new_data)
+        license_index = self._build_license_index(new_data)
+        ranking = DriverRanking(new_data, license_index)
+        return new_data, license_index, ranking, changes
+
+    def _apply_data(self, prepared, mod_time):
+        """Атомарно подменяет данные, индекс и рейтинг.
+
+        Возвращает изменения, которые нужно провести через конвейер, или None,
+        если для конвейера ничего не изменилось.
+        """
+        new_data, license_index, ranking, changes = prepared
+        previous_top = self.ranking.top_licenses
+        
+        self.data = new_data
+        self.license_index = license_index
+        self.ranking = ranking
+        self.last_modified = mod_time
+        # Версия растет при каждой подмене: сравнение идет по удостоверениям и не
+        # видит строк без номера, а они тоже попадают в рейтинг и топ
+        self.version += 1
+        changes.version = self.version
+        DATA_VERSION.set(self.version)
+        logger.info("Данные успешно загружены. Записей: %d", len(self.data))
+        RELOAD_ROWS.set(len(self.data))
+        
+        if changes or ranking.top_licenses != previous_top:
+            logger.info(
+                f"Версия данных {self.version}: добавлено {len(changes.added)}, "
+                f"удалено {len(changes.removed)}, изменено {len(changes.changed)}"
+            )
+            self.last_changes = changes
+            return changes
+        return None
+
+    @staticmethod
+    def _compact(data):
+        """Компактное представление таблицы: только нужные столбцы, категории, часы во float32"""
+        columns = [column for column in DRIVER_COLUMNS + [DEPOT_COLUMN] if column in data.columns]
+        data = data[columns].copy()
+        # Имена и депо часто повторяются - храним их словарем категорий
+        for column in ('Имя', DEPOT_COLUMN):
+            if column in data.columns:
+                data[column] = data[column].astype(str).astype('category')
+        # Часам хватает float32; зарплата остается float64, иначе теряются копейки
+        # (150000.37 превращается в 150000.38) и мелкие изменения не видны при сравнении
+        data['Часы'] = data['Часы'].astype('float32')
+        data['ЗП'] = data['ЗП'].astype('float64')
+        return data.reset_index(drop=True)
+
+    @staticmethod
+    def _build_license_index(data):
+        """Строит индекс: номер удостоверения -> позиция строки в DataFrame"""
+        index = {}
+        if 'Вод. Удоств.' not in data.columns:
+            return index
+        for position, license_number in enumerate(data['Вод. Удоств.']):
+            if pd.notna(license_number):
+                # Как и раньше, при дубликатах побеждает первая строка
+                index.setdefault(str(license_number).strip(), position)
+        return index
     
+    def _create_source(self, path):
+        """Создает источник данных по настройкам .env"""
+        source = create_data_source(
+            DATA_SOURCE, path,
+            excel_engine=EXCEL_READ_ENGINE,
+            snapshot_cache=self.snapshot_cache,
+            csv_separator=DATA_CSV_SEPARATOR,
+            sqlite_table=DATA_SQLITE_TABLE
+        )
+        logger.info(f"Источник данных: {source}")
+        return source
+
+    @profiled
+    def read_source(self):
+        """Читает текущую версию таблицы водителей из источника"""
+        return self.source.read()
+
     def get_linked_users(self):
         """Возвращает копию текущих привязок"""
         return self.linked_users.copy()
 
+    @profiled
     def load_links(self):
         """Загружает привязки из файла"""
+        self.links_writer.flush()  # Сначала дописываем отложенные изменения
         self.linked_users = {}  # Очищаем текущие данные
+        self.user_by_license = {}
         if os.path.exists(self.storage_file):
             try:
                 with open(self.storage_file, 'r', encoding='utf-8') as f:
                     saved_links = json.load(f)
                     for tg_id, link_data in saved_links.items():
-                        driver = self.find_driver_by_license(link_data['license'])
-                        if driver is not None:
-                            self.linked_users[int(tg_id)] = {
-                                'license': link_data['license'],
-                                'name': link_data['name'],
-                                'driver_data': driver.to_dict()
-                            }
-                        else:
-                            # Если водитель не найден, удаляем привязку
-                            continue
+                        license_number = str(link_data['license']).strip()
+                        # Привязки к удостоверениям, которых нет в данных, отбрасываем;
+                        # при повторной привязке одного удостоверения побеждает первая
+                        if license_number in self.license_index and license_number not in self.user_by_license:
+                            self.linked_users[int(tg_id)] = license_number
+                            self.user_by_license[license_number] = int(tg_id)
             except Exception as e:
                 logger.error(f"Ошибка загрузки привязок: {e}")
 
+    @profiled
     def save_links(self):
-        """Сохраняет текущие привязки в файл"""
-        try:
-            # Подготовка данных для сохранения (только essentials)
-            save_data = {
-                str(tg_id): {
-                    'license': data['license'],
-                    'name': data['name']
-                }
-                for tg_id, data in self.linked_users.items()
-            }
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(save_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Ошибка сохранения привязок: {e}")
+        """Ставит привязки в очередь на отложенную атомарную запись.
 
+        Снимок строится в потоке записи, один раз на серию изменений,
+        поэтому привязка или отвязка в event loop не копирует весь словарь.
+        """
+        self.links_writer.schedule(self._links_snapshot)
+
+    def _links_snapshot(self):
+        """Привязки в формате файла; вызывается из потока записи"""
+        # dict.copy() выполняется целиком под GIL, поэтому параллельная привязка
+        # в event loop не помешает обходу
+        linked_users = self.linked_users.copy()
+        # Имя водителя не сохраняем: оно всегда берется из текущих данных
+        return {str(tg_id): {'license': license_number} for tg_id, license_number in linked_users.items()}
+
+    @profiled
     def find_driver_by_license(self, license_number):
         """Поиск водителя по номеру удостоверения"""
         try:
-            license_number = str(license_number).strip()
-            driver = self.data[self.data['Вод. Удоств.'] == license_number]
-            return driver.iloc[0] if not driver.empty else None
+            position = self.license_index.get(str(license_number).strip())
+            return self.data.iloc[position] if position is not None else None
         except Exception as e:
             logger.error(f"Ошибка поиска водителя: {e}")
             return None
 
+    def get_user_by_license(self, license_number):
+        """Telegram ID пользователя, привязанного к удостоверению, или None"""
+        return self.user_by_license.get(str(license_number).strip())
+
+    def get_driver_data(self, user_id):
+        """Данные водителя, привязанного к пользователю, из текущей версии таблицы"""
+        license_number = self.linked_users.get(user_id)
+        if license_number is None:
+            return None
+        driver = self.find_driver_by_license(license_number)
+        return driver.to_dict() if driver is not None else None
+
+    @profiled
     def link_user(self, user_id, name, license_number):
         """Привязывает пользователя к удостоверению"""
         try:
+            license_number = str(license_number).strip()
+            
             # Проверяем, не привязан ли уже этот TG ID
             if user_id in self.linked_users:
                 return False, "Этот Telegram ID уже привязан"
                 
             # Проверяем, не привязано ли уже это удостоверение
-            if any(data['license'] == license_number for data in self.linked_users.values()):
+            if license_number in self.user_by_license:
                 return False, "Это удостоверение уже привязано к другому пользователю"
                 
             # Проверяем существование удостоверения
@@ -197,12 +405,8 @@ class DriverDatabase:
             if driver is None:
                 return False, "Удостоверение не найдено"
             
-            # Сохраняем привязку (используем имя из Excel)
-            self.linked_users[user_id] = {
-                'license': license_number,
-                'name': driver['Имя'],  # Берем имя из Excel
-                'driver_data': driver.to_dict()
-            }
+            self.linked_users[user_id] = license_number
+            self.user_by_license[license_number] = user_id
             
             self.save_links()
             logger.info(f"Пользователь {user_id} связан с удостоверением {license_number}")
@@ -212,11 +416,13 @@ class DriverDatabase:
             logger.error(f"Ошибка привязки пользователя: {e}")
             return False, "Ошибка привязки"
 
+    @profiled
     def unlink_user(self, user_id):
         """Отсоединяет пользователя"""
         try:
             if user_id in self.linked_users:
-                del self.linked_users[user_id]
+                license_number = self.linked_users.pop(user_id)
+                self.user_by_license.pop(license_number, None)
                 self.save_links()
                 logger.info(f"Пользователь {user_id} отсоединен")
                 return True
@@ -229,52 +435,90 @@ class DriverDatabase:
         """Возвращает список привязанных пользователей"""
         return self.linked_users
     
+    @profiled
     def get_top_drivers(self):
-        """Возвращает топ-5 водителей с кэшированием"""
+        """Возвращает топ-5 водителей из рейтинга текущей версии данных"""
         try:
-            now = datetime.now()
-            
-            # Принудительно обновляем данные, если кэш пустой или устарел
-            if self.top_cache is None or (now - self.cache_time) > timedelta(minutes=1):
-                self.load_data()  # Перезагружаем данные из Excel
-                
-                # Проверяем, что данные загружены корректно
-                if self.data.empty:
-                    logger.error("Данные не загружены или DataFrame пуст")
-                    return pd.DataFrame()  # Возвращаем пустой DataFrame
-                
-                # Сортируем и кэшируем топ-5
-                self.top_cache = self.data.sort_values('ЗП', ascending=False).head(5)
-                self.cache_time = now
-                logger.info("Кэш топа водителей обновлен")
+            top = self.ranking.top
+            if top.empty:
+                logger.error("Данные не загружены или DataFrame пуст")
+                return pd.DataFrame()  # Возвращаем пустой DataFrame
             
-            # Возвращаем копию кэша
-            return self.top_cache.copy()
+            # Возвращаем копию, чтобы вызывающий код не испортил рейтинг
+            return top.copy()
             
         except Exception as e:
             logger.error(f"Критическая ошибка при получении топа: {str(e)}", exc_info=True)
             return pd.DataFrame()  # Возвращаем пустой DataFrame при ошибке
     
+    @profiled
     def find_driver_in_top(self, license_number):
-        top = self.get_top_drivers()
-        if top.empty:
-            return False
-        return license_number in top['Вод. Удоств.'].values
+        return self.ranking.is_in_top(license_number)
     
     def update_excel_path(self, new_path):
-        """Обновляет путь к Excel файлу"""
+        """Обновляет путь к файлу данных"""
         global EXCEL_PATH
         EXCEL_PATH = new_path
+        self.source = self._create_source(new_path)
         self.last_modified = 0  # Сбрасываем время модификации для принудительной перезагрузки
         self.load_data()  # Перезагружаем данные
 
 db = DriverDatabase()
+render_cache = RenderCache()  # Готовые тексты /top и /all_achievements по версии данных
+notifier = None  # NotificationDispatcher, создается в post_init процесса бота
+command_menus = None  # CommandMenuManager, создается в post_init процесса бота
+message_cleanup = None  # MessageCleanup, создается в post_init процесса бота
+# Общий планировщик всех отправок бота: ответы в обработчиках важнее фоновых рассылок
+outbound_scheduler = OutboundScheduler(OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+LINKED_USERS.set_function(lambda: len(db.linked_users))
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTP-транспорт Bot API с замером задержки и ошибок каждого вызова"""
+    
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data=request_data, **kwargs)
+        except Exception:
+            TELEGRAM_API_ERRORS.inc(method=api_method)
+            raise
+        finally:
+            TELEGRAM_API_LATENCY.observe(time.perf_counter() - started, method=api_method)
+        if code >= 400:
+            TELEGRAM_API_ERRORS.inc(method=api_method)
+        return code, payload
+
+def count_awarded(new_achievements):
+    """Учитывает выданные достижения в метриках"""
+    for achievement in new_achievements:
+        ACHIEVEMENTS_AWARDED.inc(achievement=achievement['id'])
 
 async def post_init(application: Application):
     """Функция, которая выполняется после инициализации бота"""
-    # Запускаем фоновую задачу для обновления данных
-    asyncio.create_task(db.periodic_data_update(60))
+    global notifier, command_menus, message_cleanup
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT), METRICS_HOST)
+    
+    notifier = NotificationDispatcher(application.bot)
+    notifier.start()
+    command_menus = CommandMenuManager(application.bot)
+    command_menus.start()
+    message_cleanup = MessageCleanup(application.job_queue)
+    
+    # Достижения пересчитываются только в процессе бота, а не в менеджере
+    db.subscribe_changes(check_achievements_for_changes)
+
+async def post_shutdown(application: Application):
+    """Дописывает отложенные изменения перед остановкой бота"""
+    if notifier is not None:
+        await notifier.stop()
+    if command_menus is not None:
+        await command_menus.stop()
+    await outbound_scheduler.stop()
+    db.links_writer.flush()
 
+@profile_handler('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if user.id in db.linked_users:
@@ -294,6 +538,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return 1  # Состояние ожидания номера прав
 
+@profile_handler('handle_license')
 async def handle_license(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     license_number = update.message.text.strip()
@@ -301,14 +546,8 @@ async def handle_license(update: Update, context: ContextTypes.DEFAULT_TYPE):
     success, message = db.link_user(user.id, user.full_name, license_number)
     
     if success:
-        # Обновляем меню команд для пользователя
-        await context.bot.set_my_commands(
-            commands=[
-                ("stats", "Ваша статистика"),
-                ("top", "Топ водителей")
-            ],
-            scope=BotCommandScopeChat(user.id)
-        )
+        # Обновляем меню команд для пользователя (в фоне)
+        command_menus.request(user.id, 'driver')
         
         await update.message.reply_text(
             "✅ Вы успешно авторизованы!\n"
@@ -325,16 +564,14 @@ async def handle_license(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return ConversationHandler.END
 
+@profile_handler('stats')
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает статистику пользователя с достижениями"""
     user = update.effective_user
     
     # Проверка авторизации пользователя
     if user.id not in db.linked_users:
-        await context.bot.set_my_commands(
-            commands=[("start", "Начать авторизацию")],
-            scope=BotCommandScopeChat(user.id)
-        )
+        command_menus.request(user.id, 'guest')
         await update.message.reply_text(
             "❌ Вы не авторизованы.\n"
             "Нажмите /start для ввода номера удостоверения."
@@ -342,23 +579,45 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     try:
-        # Получаем данные водителя
-        driver_data = db.linked_users[user.id]['driver_data']
+        # Получаем данные водителя из текущей версии таблицы
+        driver_data = db.get_driver_data(user.id)
+        if driver_data is None:
+            await update.message.reply_text(
+                "⚠️ Ваше удостоверение не найдено в текущих данных.\n"
+                "Обратитесь к администратору."
+            )
+            return
         driver_data['is_in_top'] = db.find_driver_in_top(driver_data['Вод. Удоств.'])
         
+        # Место в рейтинге берется из рейтинга текущей версии данных
+        ranking = db.ranking
+        rank = ranking.rank_of(driver_data['Вод. Удоств.'])
+        rank_line = (
+            f"📈 <b>Место в рейтинге</b>: {rank} из {ranking.total} "
+            f"(топ {ranking.percentile_of(driver_data['Вод. Удоств.']):.1f}%)\n"
+            if rank is not None else ""
+        )
+        
+        # Депо есть только когда данные собраны из нескольких файлов
+        depot = driver_data.get(DEPOT_COLUMN)
+        depot_line = f"🏢 <b>Депо</b>: {depot}\n" if isinstance(depot, str) else ""
+        
         # Проверяем новые достижения
         achievement_system = get_achievement_instance()
         new_achievements = achievement_system.check_achievements(user.id, driver_data)
+        count_awarded(new_achievements)
         
         # Формируем основное сообщение
         response = (
             "📊 <b>Ваша статистика</b>:\n\n"
             f"👤 <b>Имя</b>: {driver_data['Имя']}\n"
             f"📜 <b>Вод. удостоверение</b>: {driver_data['Вод. Удоств.']}\n"
-            f"⏱ <b>Часы работы</b>: {driver_data['Часы']}\n"
-            f"💰 <b>Зарплата</b>: {driver_data['ЗП']} руб.\n\n"
+            f"{depot_line}"
+            f"⏱ <b>Часы работы</b>: {format_number(driver_data['Часы'])}\n"
+            f"💰 <b>Зарплата</b>: {format_number(driver_data['ЗП'])} руб.\n"
+            f"{rank_line}\n"
             "🏆 <b>Достижения</b>: "
-            f"{len(achievement_system.get_user_achievements(user.id))} из {len(achievement_system.available_achievements)}"
+            f"{achievement_system.count_user_achievements(user.id)} из {len(achievement_system.available_achievements)}"
         )
         
         # Создаем клавиатуру с кнопкой
@@ -394,15 +653,13 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Ошибка получения статистики: {e}")
         db.unlink_user(user.id)
-        await context.bot.set_my_commands(
-            commands=[("start", "Начать авторизацию")],
-            scope=BotCommandScopeChat(user.id)
-        )
+        command_menus.request(user.id, 'guest')
         await update.message.reply_text(
             "⚠️ Произошла ошибка при получении статистики.\n"
             "Пожалуйста, авторизуйтесь снова с помощью /start"
         )
 
+@profile_handler('achievements')
 async def achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if user.id not in db.linked_users:
@@ -417,6 +674,7 @@ async def achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = achievement_system.format_achievements_list(user_achievements)
     await update.message.reply_text(message, parse_mode='HTML')
     
+@profile_handler('all_achievements')
 async def all_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает все возможные достижения"""
     # Скрываем клавиатуру после использования
@@ -426,8 +684,18 @@ async def all_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     achievement_system = get_achievement_instance()
     
-    achievements = achievement_system.get_all_achievements_info(user.id if user.id in db.linked_users else None)
-    
+    # Текст зависит только от набора полученных достижений
+    user_id = user.id if user.id in db.linked_users else None
+    mask = achievement_system.get_user_mask(user_id) if user_id else 0
+    message = render_cache.get_or_render(
+        db.version,
+        ('all_achievements', mask),
+        lambda: render_all_achievements(achievement_system.get_all_achievements_info(user_id))
+    )
+    await update.message.reply_text(message, parse_mode='HTML')
+
+def render_all_achievements(achievements):
+    """Формирует текст со списком всех достижений"""
     message = "🏆 <b>Все возможные достижения</b>:\n\n"
     for ach in achievements:
         status = "✅" if ach.get('achieved', False) else "◻️"
@@ -437,8 +705,9 @@ async def all_achievements(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     message += "Продолжайте работать, чтобы получить все достижения!"
-    await update.message.reply_text(message, parse_mode='HTML')
+    return message
 
+@profile_handler('top')
 async def top_drivers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем и скрываем клавиатуру, если она была показана
     if context.user_data.get('keyboard_active', False):
@@ -448,105 +717,173 @@ async def top_drivers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Остальной код функции...
     try:
         logger.info("Запрос на получение топа водителей")
-        top = db.get_top_drivers()
+        # Текст топа рендерится один раз на версию данных
+        response = render_cache.get_or_render(db.version, 'top', render_top_message)
         
-        if top.empty:
+        if response is None:
             await update.message.reply_text("⚠️ Нет данных о водителях. Проверьте файл Excel.")
             return
-            
-        response = "🏆 <b>Топ-5 водителей по зарплате</b>:\n\n"
         
-        for i, (_, row) in enumerate(top.iterrows(), 1):
-            try:
-                name = str(row['Имя']) if pd.notna(row['Имя']) else "Не указано"
-                hours = str(row['Часы']) if pd.notna(row['Часы']) else "Не указано"
-                salary = str(row['ЗП']) if pd.notna(row['ЗП']) else "Не указано"
-                
-                salary_emoji = " 🔥" if i == 1 else ""
-                response += (
-                    f"{i}. <b>{name}</b>\n"
-                    f"   ⏱ Часы работы: {hours}\n"
-                    f"   💰 Зарплата: {salary} руб.{salary_emoji}\n\n"
-                )
-            except Exception as row_error:
-                logger.error(f"Ошибка обработки строки {i}: {row_error}")
-                continue
-                
         await update.message.reply_text(response, parse_mode='HTML')
         
     except Exception as e:
         logger.error(f"Фатальная ошибка при формировании топа: {str(e)}", exc_info=True)
         await update.message.reply_text("⚠️ Произошла критическая ошибка при формировании топа. Администратор уведомлен.")
 
+def format_number(value):
+    """Целые часы и суммы показываем без дробной части, остальные - до копеек"""
+    value = round(float(value), 2)
+    return str(int(value)) if value.is_integer() else f"{value:.2f}".rstrip('0')
+
+def render_top_message():
+    """Формирует текст топа водителей или None, если данных нет"""
+    top = db.get_top_drivers()
+    if top.empty:
+        return None
+    
+    response = "🏆 <b>Топ-5 водителей по зарплате</b>:\n\n"
+    
+    for i, (_, row) in enumerate(top.iterrows(), 1):
+        try:
+            name = str(row['Имя']) if pd.notna(row['Имя']) else "Не указано"
+            hours = format_number(row['Часы']) if pd.notna(row['Часы']) else "Не указано"
+            salary = format_number(row['ЗП']) if pd.notna(row['ЗП']) else "Не указано"
+            
+            salary_emoji = " 🔥" if i == 1 else ""
+            response += (
+                f"{i}. <b>{name}</b>\n"
+                f"   ⏱ Часы работы: {hours}\n"
+                f"   💰 Зарплата: {salary} руб.{salary_emoji}\n\n"
+            )
+        except Exception as row_error:
+            logger.error(f"Ошибка обработки строки {i}: {row_error}")
+            continue
+    
+    return response
+
 def get_database_instance():
     return db
 
+@profiled
+def check_achievements_for_changes(changes: DataChanges):
+    """Проверяет достижения всех привязанных пользователей после обновления данных"""
+    logger.info("Данные водителей обновлены, проверяем достижения")
+    
+    # Проверяем всех привязанных, а не только измененные строки: «Ветеран» зависит
+    # от текущей даты, а топ и «Первый вход» меняются и без изменений в строке.
+    # Векторная проверка по всей таблице все равно занимает один проход
+    ranking = db.ranking
+    license_by_user = dict(db.linked_users)
+    
+    try:
+        # Все условия считаются векторно по таблице за один проход
+        awarded = get_achievement_instance().check_achievements_batch(
+            db.data, license_by_user, db.license_index, ranking.top_licenses
+        )
+        if awarded:
+            logger.info(f"Выданы достижения пользователям: {len(awarded)}")
+            for new_achievements in awarded.values():
+                count_awarded(new_achievements)
+            notify_new_achievements(awarded)
+    except Exception as e:
+        logger.error(f"Ошибка при пакетной проверке достижений: {e}", exc_info=True)
+
+def notify_new_achievements(awarded):
+    """Ставит в очередь уведомления о достижениях, выданных в фоне (из любого потока)"""
+    if notifier is None:
+        return
+    achievement_system = get_achievement_instance()
+    notifier.enqueue_batch([
+        (
+            user_id,
+            "\n\n".join(
+                f"🎉 <b>Новое достижение!</b> 🎉\n\n{achievement_system.format_achievement(achievement)}"
+                for achievement in new_achievements
+            ),
+            {'parse_mode': 'HTML'}
+        )
+        for user_id, new_achievements in awarded.items()
+    ])
+
 async def check_drivers_updates(context: ContextTypes.DEFAULT_TYPE):
-    """Периодическая проверка обновлений данных водителей"""
+    """Единственный планировщик перезагрузки данных водителей.
+
+    Каждое изменение файла получает новую версию данных: таблица, индекс и
+    рейтинг подменяются вместе, затем один раз выполняются этапы конвейера
+    (проверка достижений).
+    """
     try:
-        # Получаем экземпляр базы данных
-        db = get_database_instance()
-        
-        # Сохраняем старые данные для сравнения
-        old_data = db.data.copy()
-        
-        # Загружаем обновленные данные
-        db.load_data()
-        
-        # Если данные изменились, обновляем информацию о достижениях
-        if not db.data.equals(old_data):
-            logger.info("Данные водителей обновлены, проверяем достижения")
-            
-            # Проверяем достижения для всех привязанных пользователей
-            achievement_system = get_achievement_instance()
-            for user_id, user_data in db.linked_users.items():
-                try:
-                    license_number = user_data['license']
-                    driver = db.find_driver_by_license(license_number)
-                    if driver is not None:
-                        driver_data = driver.to_dict()
-                        driver_data['is_in_top'] = db.find_driver_in_top(license_number)
-                        achievement_system.check_achievements(user_id, driver_data)
-                except Exception as e:
-                    logger.error(f"Ошибка при проверке достижений для пользователя {user_id}: {e}")
-                    
+        await get_database_instance().load_data_async()
     except Exception as e:
         logger.error(f"Ошибка при периодической проверке данных: {e}")
         
-def main():
-    application = Application.builder().token(TOKEN).post_init(post_init).build()
+def build_application(request=None):
+    """Собирает приложение со всеми обработчиками и фоновыми задачами.
+
+    request позволяет подменить HTTP-транспорт Bot API (используется в бенчмарках).
+    Все отправки идут через планировщик исходящих вызовов, все обработчики
+    обернуты замером задержки для метрик.
+    """
+    builder = Application.builder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+    if request is None:
+        builder = builder.request(ScheduledRequest(InstrumentedRequest(connection_pool_size=256), outbound_scheduler)) \
+                         .get_updates_request(InstrumentedRequest())
+    else:
+        builder = builder.request(ScheduledRequest(request, outbound_scheduler)).get_updates_request(request)
+    application = builder.build()
     
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
-        states={1: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_license)]},
+        entry_points=[CommandHandler('start', track_handler('start', start))],
+        states={1: [MessageHandler(filters.TEXT & ~filters.COMMAND, track_handler('handle_license', handle_license))]},
         fallbacks=[]
     )
     
     application.add_handler(conv_handler)
-    application.add_handler(CommandHandler('stats', stats))
-    application.add_handler(CommandHandler('top', top_drivers))
-    application.add_handler(CommandHandler('achievements', achievements))
-    application.add_handler(CommandHandler('all_achievements', all_achievements))
+    application.add_handler(CommandHandler('stats', track_handler('stats', stats)))
+    application.add_handler(CommandHandler('top', track_handler('top', top_drivers)))
+    application.add_handler(CommandHandler('achievements', track_handler('achievements', achievements)))
+    application.add_handler(CommandHandler('all_achievements', track_handler('all_achievements', all_achievements)))
     
     # Добавляем обработчик текстовых сообщений для кнопки
     application.add_handler(MessageHandler(
         filters.Text("Показать все достижения") & ~filters.COMMAND, 
-        all_achievements
+        track_handler('all_achievements_button', all_achievements)
     ))
     
     # Добавляем обработчик для скрытия клавиатуры при других сообщениях
     application.add_handler(MessageHandler(
         filters.TEXT & ~filters.Text("Показать все достижения") & ~filters.COMMAND, 
-        lambda update, context: remove_keyboard(update, context)
+        track_handler('remove_keyboard', remove_keyboard)
     ))
     
     application.job_queue.run_repeating(
         callback=check_drivers_updates,
-        interval=300,
+        interval=RELOAD_INTERVAL,
         first=10
     )
+    return application
+
+def main():
+    application = build_application()
     
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        errors = validate_webhook_settings(WEBHOOK_URL, WEBHOOK_PORT, WEBHOOK_SECRET)
+        if errors:
+            logger.error(f"Некорректные настройки webhook: {'; '.join(errors)}")
+            raise ValueError(f"Некорректные настройки webhook: {'; '.join(errors)}")
+        
+        # Локальный HTTP-сервер принимает обновления; запросы без верного
+        # заголовка X-Telegram-Bot-Api-Secret-Token отклоняются с кодом 403
+        logger.info(f"Запуск в режиме webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=int(WEBHOOK_PORT),
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET
+        )
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
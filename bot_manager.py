@@ -4,7 +4,8 @@ import subprocess
 import os
 import psutil
 import sys
-from bot import get_database_instance
+import secrets
+from bot import WEBHOOK_PATH, get_database_instance, validate_webhook_settings
 from achievements import get_achievement_instance
 import time
 
@@ -123,6 +124,20 @@ class UserManagerWindow:
         )
         self.achievements_btn.pack(side="left", padx=5, ipadx=10, ipady=5)
         
+        # Поиск пользователя по номеру удостоверения
+        self.search_var = tk.StringVar()
+        search_btn = ttk.Button(
+            button_frame,
+            text="Найти",
+            command=self.find_by_license,
+            style='Black.TButton'
+        )
+        search_btn.pack(side="right", padx=5, ipadx=10, ipady=5)
+        search_entry = ttk.Entry(button_frame, textvariable=self.search_var, width=15)
+        search_entry.pack(side="right", padx=5)
+        search_entry.bind("<Return>", lambda event: self.find_by_license())
+        ttk.Label(button_frame, text="Удостоверение:").pack(side="right")
+        
         # Загружаем данные
         self.load_users()
         
@@ -145,18 +160,35 @@ class UserManagerWindow:
         # Получаем свежие данные
         linked_users = self.bot_db.get_linked_users()
         
-        for tg_id, data in linked_users.items():
-            # Проверяем что данные существуют
-            if 'driver_data' in data and 'Имя' in data['driver_data']:
+        for tg_id, license_number in list(linked_users.items()):
+            # Имя берем из текущих данных водителей
+            driver = self.bot_db.find_driver_by_license(license_number)
+            if driver is not None:
                 self.tree.insert("", "end", values=(
                     tg_id,
-                    data['driver_data']['Имя'],
-                    data.get('license', '')
+                    driver['Имя'],
+                    license_number
                 ))
             else:
-                # Если данные повреждены, удаляем запись
+                # Если водителя больше нет в данных, удаляем запись
                 self.bot_db.unlink_user(tg_id)
     
+    def find_by_license(self):
+        """Выделяет пользователя, привязанного к введенному удостоверению"""
+        license_number = self.search_var.get().strip()
+        if not license_number:
+            return
+        tg_id = self.bot_db.get_user_by_license(license_number)
+        if tg_id is None:
+            messagebox.showinfo("Поиск", "К этому удостоверению никто не привязан")
+            return
+        for item in self.tree.get_children():
+            if str(self.tree.item(item)['values'][0]) == str(tg_id):
+                self.tree.selection_set(item)
+                self.tree.see(item)
+                return
+        messagebox.showinfo("Поиск", f"Удостоверение привязано к TG ID {tg_id}")
+    
     def show_context_menu(self, event):
         """Показывает контекстное меню"""
         item = self.tree.identify_row(event.y)
@@ -436,7 +468,7 @@ class BotManager:
         
         settings_win = tk.Toplevel(self.root)
         settings_win.title("Настройки системы")
-        settings_win.geometry("600x400")
+        settings_win.geometry("600x470")
         settings_win.resizable(False, False)
         
         try:
@@ -506,6 +538,71 @@ class BotManager:
             command=lambda: token_entry.config(show="" if show_token.get() else "*")
         ).pack(anchor='w')
         
+        # Вкладка режима получения обновлений
+        webhook_tab = ttk.Frame(notebook)
+        notebook.add(webhook_tab, text="Webhook")
+        
+        mode_frame = ttk.LabelFrame(webhook_tab, text=" Режим получения обновлений ", padding=10)
+        mode_frame.pack(fill='x', pady=5)
+        
+        self.bot_mode_var = tk.StringVar(value=os.getenv("BOT_MODE", "polling"))
+        ttk.Radiobutton(
+            mode_frame,
+            text="Polling (опрос серверов Telegram)",
+            variable=self.bot_mode_var,
+            value="polling"
+        ).pack(anchor='w')
+        ttk.Radiobutton(
+            mode_frame,
+            text="Webhook (Telegram сам присылает обновления)",
+            variable=self.bot_mode_var,
+            value="webhook"
+        ).pack(anchor='w')
+        
+        webhook_frame = ttk.LabelFrame(webhook_tab, text=" Настройки webhook ", padding=10)
+        webhook_frame.pack(fill='x', pady=5)
+        
+        ttk.Label(
+            webhook_frame,
+            text=f"Публичный адрес без пути (https://...), путь /{WEBHOOK_PATH} добавляется сам:"
+        ).pack(anchor='w')
+        self.webhook_url_var = tk.StringVar(value=os.getenv("WEBHOOK_URL", ""))
+        ttk.Entry(
+            webhook_frame,
+            textvariable=self.webhook_url_var,
+            width=50,
+            font=('Arial', 9)
+        ).pack(fill='x', pady=(0, 5))
+        
+        ttk.Label(webhook_frame, text="Локальный порт:").pack(anchor='w')
+        self.webhook_port_var = tk.StringVar(value=os.getenv("WEBHOOK_PORT", "8443"))
+        ttk.Entry(
+            webhook_frame,
+            textvariable=self.webhook_port_var,
+            width=10,
+            font=('Arial', 9)
+        ).pack(anchor='w', pady=(0, 5))
+        
+        ttk.Label(webhook_frame, text="Секретный токен:").pack(anchor='w')
+        secret_row = ttk.Frame(webhook_frame)
+        secret_row.pack(fill='x')
+        
+        self.webhook_secret_var = tk.StringVar(value=os.getenv("WEBHOOK_SECRET", ""))
+        ttk.Entry(
+            secret_row,
+            textvariable=self.webhook_secret_var,
+            width=40,
+            font=('Arial', 9),
+            show="*"
+        ).pack(side='left', fill='x', expand=True, padx=(0, 5))
+        
+        ttk.Button(
+            secret_row,
+            text="Сгенерировать",
+            command=lambda: self.webhook_secret_var.set(secrets.token_urlsafe(32)),
+            style='Black.TButton'
+        ).pack(side='right')
+        
         # Вкладка логов
         log_frame = ttk.Frame(notebook)
         notebook.add(log_frame, text="Логи и диагностика")
@@ -587,6 +684,10 @@ class BotManager:
         """Улучшенное сохранение настроек с проверками"""
         excel_path = self.excel_path_var.get().strip()
         bot_token = self.token_var.get().strip()
+        bot_mode = self.bot_mode_var.get()
+        webhook_url = self.webhook_url_var.get().strip()
+        webhook_port = self.webhook_port_var.get().strip()
+        webhook_secret = self.webhook_secret_var.get().strip()
         
         # Валидация данных
         errors = []
@@ -600,6 +701,9 @@ class BotManager:
         elif not bot_token.startswith('') or len(bot_token) < 30:  # Простая проверка формата токена
             errors.append("Токен бота выглядит некорректно")
         
+        if bot_mode == 'webhook':
+            errors.extend(validate_webhook_settings(webhook_url, webhook_port, webhook_secret))
+        
         if errors:
             messagebox.showerror(
                 "Ошибка в настройках",
@@ -618,23 +722,28 @@ class BotManager:
                     env_lines = f.readlines()
             
             # Обновляем параметры
+            settings = {
+                'EXCEL_PATH': excel_path,
+                'TELEGRAM_BOT_TOKEN': bot_token,
+                'BOT_MODE': bot_mode,
+                'WEBHOOK_URL': webhook_url,
+                'WEBHOOK_PORT': webhook_port,
+                'WEBHOOK_SECRET': webhook_secret
+            }
             new_lines = []
-            updated_excel = updated_token = False
+            updated = set()
             
             for line in env_lines:
-                if line.startswith('EXCEL_PATH='):
-                    new_lines.append(f'EXCEL_PATH={excel_path}\n')
-                    updated_excel = True
-                elif line.startswith('TELEGRAM_BOT_TOKEN='):
-                    new_lines.append(f'TELEGRAM_BOT_TOKEN={bot_token}\n')
-                    updated_token = True
+                key = line.split('=', 1)[0]
+                if key in settings:
+                    new_lines.append(f'{key}={settings[key]}\n')
+                    updated.add(key)
                 else:
                     new_lines.append(line)
             
-            if not updated_excel:
-                new_lines.append(f'EXCEL_PATH={excel_path}\n')
-            if not updated_token:
-                new_lines.append(f'TELEGRAM_BOT_TOKEN={bot_token}\n')
+            for key, value in settings.items():
+                if key not in updated:
+                    new_lines.append(f'{key}={value}\n')
             
             # Создаем резервную копию старого файла
             if os.path.exists('.env'):
@@ -677,6 +786,9 @@ class BotManager:
             title="Выберите файл данных",
             filetypes=[
                 ("Excel files", "*.xlsx *.xls"),
+                ("CSV files", "*.csv"),
+                ("Parquet files", "*.parquet *.pq"),
+                ("SQLite databases", "*.db *.sqlite *.sqlite3"),
                 ("All files", "*.*")
             ],
             initialdir=os.path.dirname(self.excel_path_var.get()) if self.excel_path_var.get() else os.getcwd()
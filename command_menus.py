@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from telegram import BotCommandScopeChat
+from telegram.error import Forbidden
+
+from outbound import BACKGROUND, OUTBOUND_LANE, call_with_retries
+from storage import WriteBehindWriter
+
+logger = logging.getLogger(__name__)
+
+# Меню команд, которые бот выставляет в чатах пользователей
+MENUS = {
+    'guest': [("start", "Начать авторизацию")],
+    'driver': [("stats", "Ваша статистика"), ("top", "Топ водителей")]
+}
+
+
+class CommandMenuManager:
+    """Меню команд по чатам без лишних вызовов Bot API.
+
+    Запоминает, какое меню уже выставлено в каждом чате (состояние
+    сохраняется на диск), и пропускает повторные одинаковые запросы.
+    Остальные ставятся в фоновую очередь: обработчик не ждет Telegram,
+    а несколько запросов для одного чата до отправки сливаются в один.
+    Вызовы идут через фоновую полосу планировщика исходящих вызовов.
+    """
+
+    def __init__(self, bot, storage_file: str = "command_scopes.json",
+                 max_retries: int = 3, base_backoff: float = 1.0):
+        self.bot = bot
+        self.storage_file = storage_file
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.applied: Dict[int, str] = self._load()  # {chat_id: выставленное меню}
+        self.pending: Dict[int, str] = {}  # {chat_id: меню, которое нужно выставить}
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.writer = WriteBehindWriter(storage_file, delay=2.0)
+        self.skipped = 0  # Сколько запросов не дошло до API, потому что меню уже верное
+        self._worker: Optional[asyncio.Task] = None
+
+    def _load(self) -> Dict[int, str]:
+        if not os.path.exists(self.storage_file):
+            return {}
+        try:
+            with open(self.storage_file, 'r', encoding='utf-8') as f:
+                return {int(chat_id): menu for chat_id, menu in json.load(f).items() if menu in MENUS}
+        except Exception as e:
+            logger.error(f"Ошибка загрузки состояния меню команд: {e}")
+            return {}
+
+    def _save(self):
+        # Снимок строится в потоке записи, один раз на серию изменений
+        self.writer.schedule(self._snapshot)
+
+    def _snapshot(self) -> Dict[str, str]:
+        applied = self.applied.copy()  # Копия под GIL: event loop может менять словарь
+        return {str(chat_id): menu for chat_id, menu in applied.items()}
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self.pending:
+            logger.warning(f"Не обновлено меню команд при остановке: {len(self.pending)}")
+        self.writer.flush()
+
+    def request(self, chat_id: int, menu: str) -> bool:
+        """Просит выставить меню в чате; возвращает False, если оно уже выставлено"""
+        if menu not in MENUS:
+            raise ValueError(f"Неизвестное меню команд: {menu}")
+        if chat_id not in self.pending:
+            if self.applied.get(chat_id) == menu:
+                self.skipped += 1
+                return False
+            self.queue.put_nowait(chat_id)
+        # Если чат уже в очереди, просто меняем целевое меню - вызов будет один
+        self.pending[chat_id] = menu
+        return True
+
+    async def _run(self):
+        OUTBOUND_LANE.set(BACKGROUND)
+        while True:
+            chat_id = await self.queue.get()
+            menu = self.pending.get(chat_id)
+            try:
+                if menu is not None and self.applied.get(chat_id) != menu:
+                    menu = await self._apply(chat_id, menu)
+            except Exception as e:
+                logger.error(f"Ошибка обновления меню команд {chat_id}: {e}", exc_info=True)
+            finally:
+                if self.pending.get(chat_id) == menu:
+                    self.pending.pop(chat_id, None)
+                else:
+                    # Пока шел вызов, запросили другое меню - обработаем чат еще раз
+                    self.queue.put_nowait(chat_id)
+                self.queue.task_done()
+
+    async def _apply(self, chat_id: int, menu: str) -> str:
+        """Выставляет меню с повторами; возвращает меню, отправленное последним"""
+        async def call():
+            nonlocal menu
+            # Пока ждали очереди или повтора, запрос мог смениться на другое меню
+            menu = self.pending.get(chat_id, menu)
+            await self.bot.set_my_commands(commands=MENUS[menu], scope=BotCommandScopeChat(chat_id))
+
+        try:
+            if await call_with_retries(call, f"меню команд для {chat_id}", self.max_retries, self.base_backoff):
+                self.applied[chat_id] = menu
+                self._save()
+        except Forbidden:
+            # Пользователь заблокировал бота: меню выставим заново, когда он вернется
+            if self.applied.pop(chat_id, None) is not None:
+                self._save()
+        return menu
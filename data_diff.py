@@ -0,0 +1,48 @@
+from dataclasses import dataclass, field
+from typing import List
+
+import pandas as pd
+
+LICENSE_COLUMN = 'Вод. Удоств.'
+
+
+@dataclass
+class DataChanges:
+    """Набор изменений между двумя версиями таблицы водителей (по номеру удостоверения)"""
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    version: int = 0  # Версия данных, которую породили эти изменения
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+def _keyed(data: pd.DataFrame) -> pd.DataFrame:
+    """Индексирует таблицу по номеру удостоверения так же, как find_driver_by_license"""
+    if LICENSE_COLUMN not in data.columns:
+        return data.iloc[0:0]
+    keyed = data[data[LICENSE_COLUMN].notna()]
+    keyed = keyed.set_index(keyed[LICENSE_COLUMN].astype(str).str.strip())
+    return keyed[~keyed.index.duplicated(keep='first')]
+
+
+def diff_drivers(old: pd.DataFrame, new: pd.DataFrame) -> DataChanges:
+    """Сравнивает две версии таблицы построчно и возвращает добавленные, удаленные и измененные строки"""
+    old_keyed = _keyed(old)
+    new_keyed = _keyed(new)
+
+    added = new_keyed.index.difference(old_keyed.index)
+    removed = old_keyed.index.difference(new_keyed.index)
+    common = new_keyed.index.intersection(old_keyed.index)
+
+    if list(old_keyed.columns) != list(new_keyed.columns):
+        # Изменилась структура листа - считаем измененными все общие строки
+        changed = common
+    else:
+        old_rows = old_keyed.loc[common].astype(object)
+        new_rows = new_keyed.loc[common].astype(object)
+        same = (old_rows == new_rows) | (old_rows.isna() & new_rows.isna())
+        changed = common[~same.all(axis=1).to_numpy()]
+
+    return DataChanges(added=list(added), removed=list(removed), changed=list(changed))
@@ -0,0 +1,245 @@
+"""Источники данных водителей: Excel, CSV, Parquet и таблица SQLite.
+
+Источник выбирается настройкой DATA_SOURCE (auto - по расширению файла).
+Каждый источник умеет дешево сообщить, изменились ли данные (version),
+и прочитать таблицу только с используемыми столбцами (read), номер
+удостоверения - строкой. Остальной бот работает только через этот интерфейс.
+
+Если путь указывает на папку или маску файлов (depots/*.xlsx), каждый файл
+считается отдельным депо: файлы перечитываются независимо, а результат
+склеивается в одну таблицу со столбцом DEPOT_COLUMN.
+"""
+import glob
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+from excel_reader import DRIVER_COLUMNS, LICENSE_COLUMN, read_drivers
+from snapshot_cache import SnapshotCache
+
+logger = logging.getLogger(__name__)
+
+SOURCE_KINDS = ('auto', 'excel', 'csv', 'parquet', 'sqlite')
+DEPOT_COLUMN = 'Депо'
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+SOURCE_EXTENSIONS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.db': 'sqlite',
+    '.sqlite': 'sqlite',
+    '.sqlite3': 'sqlite'
+}
+
+
+def _license_as_str(data: pd.DataFrame) -> pd.DataFrame:
+    """Приводит номер удостоверения к строке, пропуски остаются пропусками"""
+    if LICENSE_COLUMN in data.columns:
+        licenses = data[LICENSE_COLUMN]
+        data[LICENSE_COLUMN] = licenses.where(licenses.isna(), licenses.astype(str))
+    return data
+
+
+class DataSource:
+    """Базовый файловый источник: изменение определяется по mtime файла"""
+
+    kind = ""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def version(self) -> Hashable:
+        """Маркер версии данных; меняется, когда источник обновился"""
+        return os.path.getmtime(self.path)
+
+    def read(self) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def __str__(self):
+        return f"{self.kind}: {self.path}"
+
+
+class ExcelSource(DataSource):
+    kind = "excel"
+
+    def __init__(self, path: str, engine: Optional[str] = None, snapshot_cache: Optional[SnapshotCache] = None):
+        super().__init__(path)
+        self.engine = engine
+        self.snapshot_cache = snapshot_cache
+
+    def read(self) -> pd.DataFrame:
+        """Читает книгу, используя бинарный снимок, если файл не менялся"""
+        if self.snapshot_cache is None:
+            return read_drivers(self.path, self.engine)
+        fingerprint = self.snapshot_cache.fingerprint(self.path)
+        data = self.snapshot_cache.load(self.path, fingerprint)
+        if data is not None:
+            logger.info("Данные загружены из снимка, разбор Excel пропущен")
+            return data
+        data = read_drivers(self.path, self.engine)
+        self.snapshot_cache.store(self.path, fingerprint, data)
+        return data
+
+
+class CsvSource(DataSource):
+    kind = "csv"
+
+    def __init__(self, path: str, separator: str = ',', encoding: str = 'utf-8-sig'):
+        super().__init__(path)
+        self.separator = separator
+        self.encoding = encoding
+
+    def read(self) -> pd.DataFrame:
+        wanted = set(DRIVER_COLUMNS)
+        return pd.read_csv(
+            self.path,
+            sep=self.separator,
+            encoding=self.encoding,
+            usecols=lambda column: column in wanted,
+            dtype={LICENSE_COLUMN: str}
+        )
+
+
+class ParquetSource(DataSource):
+    kind = "parquet"
+
+    def read(self) -> pd.DataFrame:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Для чтения Parquet нужен pyarrow (pip install pyarrow)")
+        # Проекция столбцов на уровне файла: лишние столбцы даже не распаковываются
+        present = set(pq.read_schema(self.path).names)
+        columns = [column for column in DRIVER_COLUMNS if column in present]
+        return _license_as_str(pd.read_parquet(self.path, columns=columns, engine='pyarrow'))
+
+
+class SqliteSource(DataSource):
+    kind = "sqlite"
+
+    def __init__(self, path: str, table: str = 'drivers'):
+        super().__init__(path)
+        self.table = table
+
+    def version(self) -> Hashable:
+        # В режиме WAL свежие записи лежат в файле -wal, а основной файл не меняется
+        wal_path = self.path + '-wal'
+        wal_mtime = os.path.getmtime(wal_path) if os.path.exists(wal_path) else None
+        return os.path.getmtime(self.path), wal_mtime
+
+    def read(self) -> pd.DataFrame:
+        table = '"' + self.table.replace('"', '""') + '"'
+        uri = Path(self.path).resolve().as_uri() + '?mode=ro'
+        with closing(sqlite3.connect(uri, uri=True)) as connection:
+            present = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+            if not present:
+                raise ValueError(f"Таблица {self.table} не найдена в {self.path}")
+            columns = ", ".join('"' + column + '"' for column in DRIVER_COLUMNS if column in present)
+            data = pd.read_sql_query(f"SELECT {columns} FROM {table}", connection)
+        return _license_as_str(data)
+
+
+class ShardedSource(DataSource):
+    """Несколько файлов-депо (папка или маска), склеенные в одну таблицу.
+
+    Версия - набор (файл, версия файла), поэтому добавление, удаление или
+    изменение любого файла замечается без чтения. При чтении заново
+    разбираются только изменившиеся файлы, остальные берутся из памяти.
+    """
+
+    kind = "shards"
+
+    def __init__(self, path: str, shard_factory):
+        super().__init__(path)
+        self.shard_factory = shard_factory  # путь файла -> DataSource
+        self._shards: Dict[str, DataSource] = {}
+        self._frames: Dict[str, Tuple[Hashable, pd.DataFrame]] = {}  # {файл: (версия, таблица)}
+
+    def shard_paths(self) -> List[str]:
+        if os.path.isdir(self.path):
+            candidates = [os.path.join(self.path, name) for name in os.listdir(self.path)]
+            extensions = EXCEL_EXTENSIONS + tuple(SOURCE_EXTENSIONS)
+            candidates = [path for path in candidates if path.lower().endswith(extensions)]
+        else:
+            candidates = glob.glob(self.path)
+        # ~$книга.xlsx - служебные файлы блокировки открытых в Excel книг
+        return sorted(
+            path for path in candidates
+            if os.path.isfile(path) and not os.path.basename(path).startswith('~$')
+        )
+
+    def _shard(self, path: str) -> DataSource:
+        shard = self._shards.get(path)
+        if shard is None:
+            shard = self._shards[path] = self.shard_factory(path)
+        return shard
+
+    def version(self) -> Hashable:
+        return tuple((path, self._shard(path).version()) for path in self.shard_paths())
+
+    def read(self) -> pd.DataFrame:
+        paths = self.shard_paths()
+        frames = []
+        reparsed = []
+        for path in paths:
+            shard = self._shard(path)
+            shard_version = shard.version()
+            cached = self._frames.get(path)
+            if cached is None or cached[0] != shard_version:
+                data = shard.read()
+                data[DEPOT_COLUMN] = os.path.splitext(os.path.basename(path))[0]
+                cached = self._frames[path] = (shard_version, data)
+                reparsed.append(os.path.basename(path))
+            frames.append(cached[1])
+
+        # Забываем удаленные файлы
+        for path in set(self._frames) - set(paths):
+            del self._frames[path]
+            self._shards.pop(path, None)
+
+        if reparsed:
+            logger.info(f"Перечитаны депо: {', '.join(reparsed)} ({len(reparsed)} из {len(paths)})")
+        if not frames:
+            raise FileNotFoundError(f"Не найдено ни одного файла данных: {self.path}")
+        return pd.concat(frames, ignore_index=True)
+
+
+def is_sharded(path: str) -> bool:
+    """Путь - папка или маска файлов"""
+    if os.path.isdir(path):
+        return True
+    # Скобки и звездочки встречаются и в обычных именах папок («Отчеты [2025]»):
+    # существующий файл маской не считаем
+    return not os.path.isfile(path) and glob.has_magic(path)
+
+
+def detect_kind(path: str) -> str:
+    """Тип источника по расширению файла; по умолчанию Excel"""
+    return SOURCE_EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'excel')
+
+
+def create_data_source(kind: str, path: str, excel_engine: Optional[str] = None,
+                       snapshot_cache: Optional[SnapshotCache] = None, csv_separator: str = ',',
+                       sqlite_table: str = 'drivers') -> DataSource:
+    """Создает источник по настройке DATA_SOURCE (auto, excel, csv, parquet, sqlite)"""
+    kind = (kind or 'auto').strip().lower()
+    if is_sharded(path):
+        return ShardedSource(path, lambda shard_path: create_data_source(
+            kind, shard_path, excel_engine, snapshot_cache, csv_separator, sqlite_table
+        ))
+    if kind == 'auto':
+        kind = detect_kind(path)
+    if kind == 'excel':
+        return ExcelSource(path, excel_engine, snapshot_cache)
+    if kind == 'csv':
+        return CsvSource(path, csv_separator)
+    if kind == 'parquet':
+        return ParquetSource(path)
+    if kind == 'sqlite':
+        return SqliteSource(path, sqlite_table)
+    raise ValueError(f"Неизвестный источник данных: {kind} (допустимо: {', '.join(SOURCE_KINDS)})")
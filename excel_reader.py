@@ -0,0 +1,49 @@
+"""Чтение листа водителей из Excel.
+
+Читаются только столбцы, которые использует бот, номер удостоверения
+всегда строка. Движок разбора выбирается настройкой EXCEL_ENGINE:
+auto (по умолчанию), openpyxl или calamine.
+"""
+import importlib.util
+from typing import List, Optional
+
+import pandas as pd
+
+LICENSE_COLUMN = 'Вод. Удоств.'
+# start_date необязателен: без него просто не выдается достижение «Ветеран»
+DRIVER_COLUMNS = ['Имя', LICENSE_COLUMN, 'Часы', 'ЗП', 'start_date']
+
+# Порядок предпочтения для auto: calamine (на Rust) разбирает xlsx в разы быстрее openpyxl
+ENGINE_MODULES = {'calamine': 'python_calamine', 'openpyxl': 'openpyxl'}
+
+
+def available_engines() -> List[str]:
+    """Установленные движки разбора в порядке предпочтения"""
+    return [engine for engine, module in ENGINE_MODULES.items() if importlib.util.find_spec(module) is not None]
+
+
+def resolve_engine(name: str = 'auto') -> Optional[str]:
+    """Проверяет настройку движка и возвращает имя для pandas.
+
+    Для auto без calamine возвращается None: pandas сам выберет движок по
+    типу файла (openpyxl для xlsx, xlrd для старых xls).
+    """
+    name = (name or 'auto').strip().lower()
+    if name == 'auto':
+        return 'calamine' if 'calamine' in available_engines() else None
+    if name not in ENGINE_MODULES:
+        raise ValueError(f"Неизвестный движок чтения Excel: {name} (допустимо: auto, {', '.join(ENGINE_MODULES)})")
+    if importlib.util.find_spec(ENGINE_MODULES[name]) is None:
+        raise ImportError(f"Движок чтения Excel {name} не установлен (pip install {ENGINE_MODULES[name].replace('_', '-')})")
+    return name
+
+
+def read_drivers(path: str, engine: Optional[str] = None) -> pd.DataFrame:
+    """Читает первый лист книги: только столбцы DRIVER_COLUMNS, удостоверение - строкой"""
+    wanted = set(DRIVER_COLUMNS)
+    return pd.read_excel(
+        path,
+        engine=engine,
+        usecols=lambda column: column in wanted,
+        dtype={LICENSE_COLUMN: str}
+    )
@@ -0,0 +1,44 @@
+import logging
+from typing import Dict, List
+
+from telegram.error import TelegramError
+
+from outbound import BACKGROUND, OUTBOUND_LANE
+
+logger = logging.getLogger(__name__)
+
+# Bot API удаляет не больше 100 сообщений за один вызов deleteMessages
+MAX_BATCH = 100
+
+
+class MessageCleanup:
+    """Отложенное удаление служебных сообщений через JobQueue.
+
+    Обработчик только регистрирует id отправленного сообщения и сразу
+    возвращается. Сообщения копятся по чатам: на чат планируется одна
+    задача, которая через delay секунд удаляет все накопленные сообщения
+    пачкой через фоновую полосу планировщика исходящих вызовов.
+    """
+
+    def __init__(self, job_queue, delay: float = 1.0):
+        self.job_queue = job_queue
+        self.delay = delay
+        self.pending: Dict[int, List[int]] = {}  # {chat_id: [message_id, ...]}
+
+    def schedule(self, chat_id: int, message_id: int):
+        message_ids = self.pending.setdefault(chat_id, [])
+        message_ids.append(message_id)
+        if len(message_ids) == 1:
+            # Задача для чата еще не запланирована - планируем
+            self.job_queue.run_once(self._delete_pending, self.delay, chat_id=chat_id, name=f"cleanup:{chat_id}")
+
+    async def _delete_pending(self, context):
+        OUTBOUND_LANE.set(BACKGROUND)
+        chat_id = context.job.chat_id
+        message_ids = self.pending.pop(chat_id, [])
+        for start in range(0, len(message_ids), MAX_BATCH):
+            try:
+                await context.bot.delete_messages(chat_id=chat_id, message_ids=message_ids[start:start + MAX_BATCH])
+            except TelegramError as e:
+                # Сообщение могли удалить вручную или чат недоступен - не критично
+                logger.warning(f"Не удалось удалить служебные сообщения в чате {chat_id}: {e}")
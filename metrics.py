@@ -0,0 +1,252 @@
+"""Метрики процесса бота в текстовом формате Prometheus.
+
+Реализация минимальная и без внешних зависимостей: счетчики, датчики и
+гистограммы с метками плюс HTTP-сервер, отдающий их по /metrics.
+"""
+import logging
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), func: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._func = func
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, func: Callable[[], float]):
+        """Значение вычисляется при каждом считывании метрик"""
+        self._func = func
+
+    def _samples(self):
+        if self._func is not None:
+            try:
+                return [f"{self.name} {_format_value(self._func())}"]
+            except Exception as e:
+                logger.warning(f"Не удалось вычислить метрику {self.name}: {e}")
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values: Dict[Tuple, list] = {}  # {метки: [счетчики по корзинам..., сумма, количество]}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        """Контекстный менеджер: измеряет длительность блока"""
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Не засоряем stderr записями о каждом опросе
+        pass
+
+
+def start_metrics_server(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Запускает HTTP-сервер метрик в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
+
+
+def track_handler(command: str, callback):
+    """Оборачивает обработчик команды замером задержки и счетчиком ошибок"""
+    @wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(command=command)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, command=command)
+    return wrapper
+
+
+# Метрики бота
+
+HANDLER_LATENCY = Histogram(
+    'taxibot_handler_latency_seconds', "Время обработки команды", ['command']
+)
+HANDLER_ERRORS = Counter(
+    'taxibot_handler_errors_total', "Необработанные исключения в обработчиках команд", ['command']
+)
+RELOAD_DURATION = Histogram(
+    'taxibot_reload_duration_seconds', "Длительность перезагрузки данных водителей",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+RELOAD_ROWS = Gauge('taxibot_reload_rows', "Число строк в текущей версии данных")
+DATA_VERSION = Gauge('taxibot_data_version', "Текущая версия набора данных")
+RENDER_CACHE_REQUESTS = Counter(
+    'taxibot_render_cache_requests_total', "Обращения к кэшу готовых сообщений", ['cache', 'result']
+)
+LINKED_USERS = Gauge('taxibot_linked_users', "Число привязанных пользователей")
+ACHIEVEMENTS_AWARDED = Counter(
+    'taxibot_achievements_awarded_total', "Выданные достижения", ['achievement']
+)
+TELEGRAM_API_LATENCY = Histogram(
+    'taxibot_telegram_api_latency_seconds', "Время вызова Bot API", ['method']
+)
+TELEGRAM_API_ERRORS = Counter(
+    'taxibot_telegram_api_errors_total', "Ошибки вызовов Bot API", ['method']
+)
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    'taxibot_outbound_queue_depth', "Вызовы Bot API, ожидающие разрешения планировщика", ['lane']
+)
+OUTBOUND_WAIT = Histogram(
+    'taxibot_outbound_wait_seconds', "Ожидание разрешения планировщика исходящих вызовов", ['lane']
+)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.error import Forbidden
+
+from outbound import BACKGROUND, OUTBOUND_LANE, call_with_retries
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Фоновая рассылка уведомлений через ограниченную очередь.
+
+    Отправки идут через фоновую полосу планировщика исходящих вызовов
+    (outbound), поэтому рассылка уступает ответам пользователям и не
+    превышает лимиты Telegram. Несколько воркеров отправляют параллельно,
+    поэтому скорость рассылки ограничивает планировщик, а не время ответа
+    Bot API. Сетевые ошибки повторяются с экспоненциальной задержкой.
+    Постановка в очередь не блокирует вызывающий код: сверх max_queue
+    уведомления отбрасываются.
+    """
+
+    def __init__(self, bot, max_queue: int = 100000, workers: int = 16,
+                 max_retries: int = 5, base_backoff: float = 1.0):
+        self.bot = bot
+        # Первая проверка после запуска выдает «Новичка» всем привязанным сразу,
+        # поэтому лимит очереди рассчитан на пачку размером с весь парк
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.dropped = 0
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        if not self._workers:
+            self._loop = asyncio.get_running_loop()
+            self._workers = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if not self.queue.empty():
+            logger.warning(f"Не отправлено уведомлений при остановке: {self.queue.qsize()}")
+
+    def enqueue(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Ставит уведомление в очередь; возвращает False, если очередь переполнена"""
+        return self._put([(chat_id, text, kwargs)]) == 1
+
+    def enqueue_batch(self, items: List[Tuple[int, str, Dict[str, Any]]]):
+        """Ставит в очередь пачку уведомлений (chat_id, текст, параметры).
+
+        Можно вызывать из пула потоков (этапы конвейера перезагрузки):
+        постановка в очередь все равно выполнится в event loop.
+        """
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if not in_loop and self._loop is not None:
+            self._loop.call_soon_threadsafe(self.enqueue_batch, items)
+            return
+        self._put(items)
+
+    def _put(self, items) -> int:
+        """Кладет в очередь сколько помещается; об отброшенных пишет одной строкой"""
+        free = max(0, self.max_queue - self.queue.qsize())
+        for item in items[:free]:
+            self.queue.put_nowait(item)
+        dropped = len(items) - min(free, len(items))
+        if dropped:
+            self.dropped += dropped
+            logger.warning(f"Очередь уведомлений переполнена ({self.max_queue}), отброшено уведомлений: {dropped}")
+        return len(items) - dropped
+
+    async def _run(self):
+        OUTBOUND_LANE.set(BACKGROUND)
+        while True:
+            chat_id, text, kwargs = await self.queue.get()
+            try:
+                await self._send(chat_id, text, kwargs)
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомления {chat_id}: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, chat_id: int, text: str, kwargs):
+        try:
+            await call_with_retries(
+                lambda: self.bot.send_message(chat_id=chat_id, text=text, **kwargs),
+                f"уведомление для {chat_id}", self.max_retries, self.base_backoff
+            )
+        except Forbidden:
+            # Пользователь заблокировал бота - повторять бессмысленно
+            logger.info(f"Уведомление не доставлено, пользователь {chat_id} заблокировал бота")
@@ -0,0 +1,314 @@
+"""Планировщик исходящих вызовов Bot API.
+
+Все вызовы, отправляющие что-то в чаты, проходят через общий лимит бота
+и лимит на каждый чат (token bucket). Заявки разделены на две полосы:
+interactive - ответы пользователю в обработчиках, background - рассылки
+и служебные вызовы (уведомления, меню команд). Пока есть готовые к
+отправке интерактивные заявки, фоновые ждут.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+from telegram.request import BaseRequest
+
+from metrics import OUTBOUND_QUEUE_DEPTH, OUTBOUND_WAIT
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+LANES = (INTERACTIVE, BACKGROUND)  # В порядке приоритета
+
+# Полоса текущей задачи; фоновые воркеры переключают ее на BACKGROUND
+OUTBOUND_LANE: contextvars.ContextVar[str] = contextvars.ContextVar('outbound_lane', default=INTERACTIVE)
+
+# Сколько заявок полосы просматривать в поисках чата, не упершегося в свой лимит
+SCAN_LIMIT = 256
+
+
+class _Bucket:
+    """Token bucket: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд появится токен (0 - уже есть)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundScheduler:
+    """Выдает разрешения на вызовы Bot API с учетом лимитов и приоритета полос.
+
+    Нулевая скорость отключает соответствующий лимит.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global: Optional[_Bucket] = None
+        self._chats: Dict[object, _Bucket] = {}
+        self._lanes: Dict[str, Deque[Tuple[object, asyncio.Future, float]]] = {lane: deque() for lane in LANES}
+        self._paused_until = 0.0
+        self._chat_paused_until: Dict[object, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.granted = {lane: 0 for lane in LANES}
+        self.total_wait = {lane: 0.0 for lane in LANES}
+
+    def start(self):
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Ожидающим вызовам больше некому выдать разрешение - отпускаем их
+        for queue in self._lanes.values():
+            while queue:
+                _, future, _ = queue.popleft()
+                if not future.done():
+                    future.set_result(None)
+        self._update_depth()
+
+    async def acquire(self, chat_id=None, lane: Optional[str] = None):
+        """Ждет разрешения на один вызов в чат chat_id (None - только общий лимит)"""
+        lane = lane or OUTBOUND_LANE.get()
+        if not self.global_rate and not self.chat_rate:
+            # Лимиты выключены, но паузу после 429 все равно выдерживаем
+            now = asyncio.get_running_loop().time()
+            delay = max(self._paused_until - now, self._chat_pause(chat_id, now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._lanes[lane].append((chat_id, future, loop.time()))
+        self._update_depth()
+        self._wakeup.set()
+        await future
+
+    def pause(self, seconds: float, chat_id=None):
+        """Приостанавливает отправки в чат chat_id (None - все отправки): Telegram ответил 429"""
+        now = asyncio.get_running_loop().time()
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, now + seconds)
+            logger.warning(f"Telegram просит подождать {seconds} с, исходящие вызовы приостановлены")
+            return
+        # Паузы редки, поэтому истекшие просто вычищаем здесь
+        self._chat_paused_until = {key: until for key, until in self._chat_paused_until.items() if until > now}
+        self._chat_paused_until[chat_id] = max(self._chat_paused_until.get(chat_id, 0.0), now + seconds)
+        logger.warning(f"Telegram просит подождать {seconds} с, вызовы в чат {chat_id} приостановлены")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _chat_pause(self, chat_id, now: float) -> float:
+        """Сколько еще длится пауза чата после 429 (0 - паузы нет)"""
+        until = self._chat_paused_until.get(chat_id) if chat_id is not None else None
+        return until - now if until is not None and until > now else 0.0
+
+    def queue_depth(self) -> Dict[str, int]:
+        return {lane: len(queue) for lane, queue in self._lanes.items()}
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Глубина очереди, число выданных разрешений и среднее ожидание по полосам"""
+        return {
+            lane: {
+                "queued": len(self._lanes[lane]),
+                "granted": self.granted[lane],
+                "avg_wait_seconds": self.total_wait[lane] / self.granted[lane] if self.granted[lane] else 0.0
+            }
+            for lane in LANES
+        }
+
+    def _update_depth(self):
+        for lane, queue in self._lanes.items():
+            OUTBOUND_QUEUE_DEPTH.set(len(queue), lane=lane)
+
+    def _chat_bucket(self, chat_id, now: float) -> Optional[_Bucket]:
+        if chat_id is None or not self.chat_rate:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Забываем чаты, которые давно ничего не отправляли (их ведро полное)
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_full(now)}
+            bucket = self._chats[chat_id] = _Bucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _pick(self, now: float):
+        """Первая заявка по приоритету полос, чей чат не уперся в свой лимит.
+
+        Возвращает (полоса, заявка) или (None, через сколько проверить снова).
+        """
+        min_wait = None
+        for lane in LANES:
+            queue = self._lanes[lane]
+            while queue and queue[0][1].done():
+                queue.popleft()  # Вызов отменили, пока он ждал
+            for index, entry in enumerate(queue):
+                if index >= SCAN_LIMIT:
+                    break
+                if entry[1].done():
+                    continue
+                bucket = self._chat_bucket(entry[0], now)
+                wait = bucket.wait_time(now) if bucket is not None else 0.0
+                wait = max(wait, self._chat_pause(entry[0], now))
+                if wait <= 0:
+                    del queue[index]
+                    return lane, entry
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, min_wait
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Выдает все возможные сейчас разрешения; возвращает, сколько ждать до следующей попытки"""
+        while True:
+            if not any(self._lanes.values()):
+                return None
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.global_rate:
+                if self._global is None:
+                    self._global = _Bucket(self.global_rate, self.global_rate, now)
+                global_wait = self._global.wait_time(now)
+                if global_wait > 0:
+                    return global_wait
+            lane, entry = self._pick(now)
+            if lane is None:
+                return entry
+            chat_id, future, enqueued = entry
+            if self._global is not None:
+                self._global.take(now)
+            bucket = self._chat_bucket(chat_id, now)
+            if bucket is not None:
+                bucket.take(now)
+            future.set_result(None)
+            self.granted[lane] += 1
+            self.total_wait[lane] += now - enqueued
+            OUTBOUND_WAIT.observe(now - enqueued, lane=lane)
+            self._update_depth()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            wait = self._dispatch(loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def call_with_retries(call: Callable[[], Awaitable], description: str,
+                            max_retries: int, base_backoff: float) -> bool:
+    """Выполняет фоновый вызов Bot API с повторами; True, если вызов прошел.
+
+    После 429 повторяет сразу: следующая попытка дождется в планировщике
+    паузы, которую задал Telegram. Сетевые ошибки повторяются с
+    экспоненциальной задержкой, остальные ошибки Telegram пишутся в лог.
+    Forbidden (пользователь заблокировал бота) пробрасывается вызывающему.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            await call()
+            return True
+        except RetryAfter:
+            continue
+        except Forbidden:
+            raise
+        except BadRequest as e:
+            # BadRequest наследует NetworkError, но повтор его не исправит
+            logger.error(f"Telegram отклонил вызов ({description}): {e}")
+            return False
+        except (TimedOut, NetworkError) as e:
+            delay = base_backoff * 2 ** attempt
+            logger.warning(f"Сетевая ошибка ({description}): {e}, повтор через {delay} с")
+            await asyncio.sleep(delay)
+        except TelegramError as e:
+            logger.error(f"Telegram отклонил вызов ({description}): {e}")
+            return False
+    logger.error(f"Вызов не выполнен после {max_retries + 1} попыток ({description})")
+    return False
+
+
+class ScheduledRequest(BaseRequest):
+    """HTTP-транспорт Bot API, пропускающий отправки через OutboundScheduler.
+
+    Оборачивает любой другой транспорт. На 429 приостанавливает отправки
+    в этот чат (для вызовов без чата - весь планировщик) и, если ждать
+    недолго, повторяет вызов сам.
+    """
+
+    # Служебные методы, которые не отправляют ничего в чаты
+    UNLIMITED_METHODS = frozenset({
+        'getMe', 'getUpdates', 'setWebhook', 'deleteWebhook', 'getWebhookInfo', 'logOut', 'close'
+    })
+
+    def __init__(self, inner: BaseRequest, scheduler: OutboundScheduler,
+                 flood_retries: int = 1, max_retry_wait: float = 10.0):
+        self.inner = inner
+        self.scheduler = scheduler
+        self.flood_retries = flood_retries
+        self.max_retry_wait = max_retry_wait
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    @property
+    def read_timeout(self):
+        return self.inner.read_timeout
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if url.rsplit('/', 1)[-1] in self.UNLIMITED_METHODS:
+            return await self.inner.do_request(url, method, request_data=request_data, **kwargs)
+
+        chat_id = request_data.parameters.get('chat_id') if request_data else None
+        for attempt in range(self.flood_retries + 1):
+            await self.scheduler.acquire(chat_id)
+            code, payload = await self.inner.do_request(url, method, request_data=request_data, **kwargs)
+            if code != 429:
+                break
+            retry_after = self._retry_after(payload)
+            self.scheduler.pause(retry_after, chat_id)
+            if retry_after > self.max_retry_wait:
+                break
+        return code, payload
+
+    @staticmethod
+    def _retry_after(payload: bytes) -> float:
+        try:
+            return float(json.loads(payload.decode('utf-8'))['parameters']['retry_after'])
+        except Exception:
+            return 1.0
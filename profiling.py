@@ -0,0 +1,144 @@
+"""Профилирование горячих путей бота по запросу.
+
+Включается без изменения кода переменными окружения (или .env):
+    BOT_PROFILE=1               - замер времени каждого вызова
+    BOT_PROFILE_TRACEMALLOC=1   - дополнительно прирост памяти через tracemalloc
+    BOT_PROFILE_SLOW_MS=200     - порог, выше которого вызов пишется в лог
+
+Когда профилирование выключено, декораторы возвращают функцию как есть,
+поэтому накладных расходов нет совсем.
+"""
+import asyncio
+import atexit
+import contextvars
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from functools import wraps
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+# Декораторы применяются при импорте модулей, раньше чем bot.py читает .env,
+# поэтому настройки профилирования подгружаем здесь же (окружение не перезаписывается)
+load_dotenv(Path(__file__).parent / '.env')
+
+ENABLED = os.getenv("BOT_PROFILE", "").strip().lower() in ("1", "true", "yes")
+TRACE_MEMORY = ENABLED and os.getenv("BOT_PROFILE_TRACEMALLOC", "").strip().lower() in ("1", "true", "yes")
+SLOW_MS = float(os.getenv("BOT_PROFILE_SLOW_MS", "200"))
+
+if TRACE_MEMORY:
+    tracemalloc.start()
+
+# Команда и пользователь, в рамках которых идет текущий вызов
+_current_command: contextvars.ContextVar[Optional[Tuple[str, Optional[int]]]] = \
+    contextvars.ContextVar('profiling_command', default=None)
+
+_stats: Dict[str, Dict[str, float]] = {}  # {имя: {calls, total_ms, max_ms, memory_bytes, slow}}
+_stats_lock = threading.Lock()
+
+
+def _record(name: str, elapsed_ms: float, memory_bytes: Optional[int]):
+    with _stats_lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "memory_bytes": 0, "slow": 0}
+        entry["calls"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        if memory_bytes is not None:
+            entry["memory_bytes"] += memory_bytes
+        if elapsed_ms >= SLOW_MS:
+            entry["slow"] += 1
+
+    if elapsed_ms >= SLOW_MS:
+        current = _current_command.get()
+        where = f"обработчик {current[0]}, пользователь {current[1]}" if current else "вне команды"
+        memory = f", память {memory_bytes / 1024:+.1f} КБ" if memory_bytes is not None else ""
+        logger.warning(f"Медленный вызов {name}: {elapsed_ms:.1f} мс{memory} ({where})")
+
+
+def _measure(name: str, func):
+    """Оборачивает синхронную или асинхронную функцию замером"""
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            memory_before = tracemalloc.get_traced_memory()[0] if TRACE_MEMORY else None
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                # Для корутин в прирост попадают и аллокации параллельных задач
+                memory = tracemalloc.get_traced_memory()[0] - memory_before if TRACE_MEMORY else None
+                _record(name, elapsed_ms, memory)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        memory_before = tracemalloc.get_traced_memory()[0] if TRACE_MEMORY else None
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            memory = tracemalloc.get_traced_memory()[0] - memory_before if TRACE_MEMORY else None
+            _record(name, elapsed_ms, memory)
+    return wrapper
+
+
+def profiled(func):
+    """Замер времени метода (имя в отчете - Класс.метод)"""
+    if not ENABLED:
+        return func
+    return _measure(func.__qualname__, func)
+
+
+def profile_handler(command: str):
+    """Замер обработчика команды; вложенные медленные вызовы помечаются командой и пользователем"""
+    def decorator(callback):
+        if not ENABLED:
+            return callback
+        measured = _measure(f"handler:{command}", callback)
+
+        @wraps(callback)
+        async def wrapper(update, context):
+            user = getattr(update, 'effective_user', None)
+            token = _current_command.set((command, user.id if user else None))
+            try:
+                return await measured(update, context)
+            finally:
+                _current_command.reset(token)
+        return wrapper
+    return decorator
+
+
+def get_stats() -> Dict[str, Dict[str, float]]:
+    """Копия накопленной статистики по вызовам"""
+    with _stats_lock:
+        return {name: dict(entry) for name, entry in _stats.items()}
+
+
+def log_summary():
+    """Пишет в лог сводку: самые затратные по суммарному времени вызовы"""
+    stats = get_stats()
+    if not stats:
+        return
+    lines = []
+    for name, entry in sorted(stats.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        line = (f"{name}: вызовов {entry['calls']}, всего {entry['total_ms']:.1f} мс, "
+                f"среднее {entry['total_ms'] / entry['calls']:.2f} мс, макс {entry['max_ms']:.1f} мс, "
+                f"медленных {entry['slow']}")
+        if TRACE_MEMORY:
+            line += f", память {entry['memory_bytes'] / 1024:+.1f} КБ"
+        lines.append(line)
+    logger.info("Сводка профилирования:\n" + "\n".join(lines))
+
+
+if ENABLED:
+    atexit.register(log_summary)
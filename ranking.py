@@ -0,0 +1,56 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+TOP_SIZE = 5
+
+
+class DriverRanking:
+    """Рейтинг водителей по зарплате, построенный один раз на версию данных.
+
+    Топ выбирается частичной сортировкой, а место любого водителя
+    хранится в словаре по номеру удостоверения. Водители с одинаковой
+    зарплатой делят место (1, 2, 2, 4...).
+    """
+
+    def __init__(self, data: pd.DataFrame, license_index: Dict[str, int], top_size: int = TOP_SIZE):
+        salaries = data['ЗП'].to_numpy(dtype=float) if 'ЗП' in data.columns else np.empty(0)
+        self.total = len(salaries)
+
+        k = min(top_size, self.total)
+        if k:
+            top_positions = np.argpartition(-salaries, k - 1)[:k]
+            top_positions = top_positions[np.argsort(-salaries[top_positions], kind='stable')]
+        else:
+            top_positions = np.empty(0, dtype=int)
+        self.top = data.iloc[top_positions]
+
+        # Место = 1 + число водителей со строго большей зарплатой
+        sorted_salaries = np.sort(salaries)
+        greater = self.total - np.searchsorted(sorted_salaries, salaries, side='right')
+        ranks = greater + 1
+        self.rank_by_license: Dict[str, int] = {
+            license_number: int(ranks[position])
+            for license_number, position in license_index.items()
+        }
+
+        positions = set(top_positions.tolist())
+        self.top_licenses = frozenset(
+            license_number for license_number, position in license_index.items()
+            if position in positions
+        )
+
+    def rank_of(self, license_number) -> Optional[int]:
+        """Место водителя в рейтинге или None, если его нет в данных"""
+        return self.rank_by_license.get(str(license_number).strip())
+
+    def percentile_of(self, license_number) -> Optional[float]:
+        """В какой процент лучших водителей входит водитель (меньше - лучше)"""
+        rank = self.rank_of(license_number)
+        if rank is None or not self.total:
+            return None
+        return rank / self.total * 100
+
+    def is_in_top(self, license_number) -> bool:
+        return str(license_number).strip() in self.top_licenses
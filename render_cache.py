@@ -0,0 +1,28 @@
+from typing import Any, Callable, Dict, Hashable
+
+from metrics import RENDER_CACHE_REQUESTS
+
+
+class RenderCache:
+    """Кэш готовых текстов сообщений, привязанный к версии данных.
+
+    Как только запрашивается другая версия данных, все ранее
+    отрендеренные тексты отбрасываются.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._items: Dict[Hashable, Any] = {}
+
+    def get_or_render(self, version, key: Hashable, render: Callable[[], Any]):
+        if version != self.version:
+            self._items.clear()
+            self.version = version
+        cache_name = key[0] if isinstance(key, tuple) else key
+        if key in self._items:
+            RENDER_CACHE_REQUESTS.inc(cache=cache_name, result='hit')
+            return self._items[key]
+        RENDER_CACHE_REQUESTS.inc(cache=cache_name, result='miss')
+        value = render()
+        self._items[key] = value
+        return value
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from storage import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    """Бинарные снимки распарсенных таблиц, чтобы не разбирать Excel заново.
+
+    Снимок привязан к пути, времени изменения, размеру и хэшу содержимого
+    исходного файла. Если хоть что-то из этого не совпадает, снимок
+    считается устаревшим и будет перестроен после следующего разбора.
+    """
+
+    FORMAT_VERSION = 2  # 2: в снимке только используемые столбцы, удостоверение - строка
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, cache_dir: str = ".excel_cache"):
+        self.cache_dir = cache_dir
+
+    def _snapshot_paths(self, source_path: str) -> Tuple[str, str]:
+        """Пути к файлу снимка и к файлу с его метаданными"""
+        key = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".pkl", base + ".json"
+
+    def fingerprint(self, source_path: str) -> Dict:
+        """Ключ снимка: путь, mtime, размер и хэш содержимого файла"""
+        stat = os.stat(source_path)
+        digest = hashlib.sha1()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return {
+            'version': self.FORMAT_VERSION,
+            'path': os.path.abspath(source_path),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': digest.hexdigest()
+        }
+
+    def load(self, source_path: str, fingerprint: Dict) -> Optional[pd.DataFrame]:
+        """Возвращает снимок, если он соответствует файлу, иначе None"""
+        data_path, meta_path = self._snapshot_paths(source_path)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta != fingerprint:
+                return None
+            return pd.read_pickle(data_path)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать снимок {data_path}: {e}")
+            return None
+
+    def store(self, source_path: str, fingerprint: Dict, data: pd.DataFrame):
+        """Сохраняет снимок; метаданные пишутся последними"""
+        data_path, meta_path = self._snapshot_paths(source_path)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            atomic_write(data_path, data.to_pickle, binary=True)
+            atomic_write(meta_path, lambda f: json.dump(fingerprint, f))
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить снимок {data_path}: {e}")
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import IO, Callable
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path: str, write: Callable[[IO], None], binary: bool = False):
+    """Атомарно записывает файл: временный файл рядом с целевым, fsync, переименование.
+
+    write(f) пишет содержимое в открытый временный файл. У каждого писателя
+    свой временный файл, поэтому процессы бота и менеджера не мешают друг
+    другу. При сбое посреди записи на диске остается либо старая, либо
+    новая версия файла, но не обрезанная.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding='utf-8')) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, data, **dump_kwargs):
+    """Атомарно записывает JSON (см. atomic_write)"""
+    atomic_write(path, lambda f: json.dump(data, f, **dump_kwargs))
+
+
+class WriteBehindWriter:
+    """Отложенная атомарная запись JSON в фоновом потоке.
+
+    Серия изменений за время задержки сливается в одну запись последней
+    версии данных. Вызывающий код (в том числе event loop) не ждет диска.
+    Вместо готовых данных можно передать функцию, строящую снимок: тогда
+    он строится один раз в потоке записи, а не при каждом изменении.
+    """
+
+    def __init__(self, path: str, delay: float = 1.0, **dump_kwargs):
+        self.path = path
+        self.delay = delay
+        self.dump_kwargs = dump_kwargs
+        self._pending = None
+        self._has_pending = False
+        self._state_lock = threading.Lock()  # защищает _pending
+        self._write_lock = threading.Lock()  # не дает двум записям идти одновременно
+        self._failures = 0  # Неудачных записей подряд: от них зависит пауза перед повтором
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"write-behind:{path}", daemon=True)
+        self._thread.start()
+
+    def schedule(self, data):
+        """Ставит версию данных (или функцию без аргументов, возвращающую ее) в очередь
+        на запись; более старая версия отбрасывается"""
+        with self._state_lock:
+            self._pending = data
+            self._has_pending = True
+        self._wakeup.set()
+
+    def flush(self):
+        """Синхронно записывает отложенную версию, если она есть"""
+        with self._write_lock:
+            with self._state_lock:
+                if not self._has_pending:
+                    return
+                data = self._pending
+                self._pending = None
+                self._has_pending = False
+            try:
+                atomic_write_json(self.path, data() if callable(data) else data, **self.dump_kwargs)
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                logger.error(f"Ошибка записи {self.path}: {e}")
+                # Возвращаем версию в очередь, если ее еще не заменила более новая,
+                # и будим поток записи, чтобы повторить, не дожидаясь нового изменения
+                with self._state_lock:
+                    if not self._has_pending:
+                        self._pending = data
+                        self._has_pending = True
+                self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # Даем накопиться серии изменений, затем пишем одну версию; после
+            # неудачных записей (файл занят другим процессом) ждем дольше
+            backoff = max(self.delay, 1.0) * 2 ** min(self._failures, 6) if self._failures else self.delay
+            time.sleep(backoff)
+            self._wakeup.clear()
+            self.flush()